@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import argparse
+
+from h2lang.load_data import get_missions
+from h2lang.results import mission_version
+from h2lang.speech import SPEECH_FILENAME, SpeechData, load_speech, save_speech
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+            description='Work out when the speech in each sound file of an extracted archive starts and ends (needs numpy).')
+    parser.add_argument('archive', type=str, help='Path to the extracted archive')
+    parser.add_argument('--output', type=str, default=SPEECH_FILENAME,
+            help='File to keep the results in. Files that haven\'t changed since they were analysed are skipped.')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+            help='Number of processes to analyse the sound files with.')
+    parser.add_argument('--window', type=float, default=None,
+            help='Length of the windows that are checked for speech, in seconds.')
+    parser.add_argument('--threshold-db', type=float, default=None,
+            help='RMS level (relative to full scale) above which a window has speech in it.')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.archive):
+        sys.stderr.write('Not a directory: {}\n'.format(args.archive))
+        return 1
+
+    from h2lang.silence import WINDOW, THRESHOLD_DB, analyse_archive
+
+    # The bounds are only used with the same data they were analysed from.
+    missions = get_missions(args.archive, jobs=args.jobs, dump=False)
+    if not missions:
+        return 1
+
+    start = time.perf_counter()
+    old = load_speech(args.output)
+    speech, num_analysed, errors = analyse_archive(args.archive, old, args.jobs,
+            WINDOW if args.window is None else args.window,
+            THRESHOLD_DB if args.threshold_db is None else args.threshold_db)
+    speech = SpeechData(speech.settings, speech.records,
+            {key: mission_version(mission) for key, mission in missions.items()})
+    save_speech(speech, args.output)
+    for err in errors:
+        sys.stderr.write('Could not analyse: {}\n'.format(err))
+    print('Analysed {} of {} sound files in {:.1f} s, wrote {}'.format(
+        num_analysed, len(speech.records), time.perf_counter() - start, args.output))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import sys
+import argparse
+
+from h2lang.common import LANGUAGES
+from h2lang.lines import LineIndex
+from h2lang.load_data import get_missions
+from h2lang.speech import load_speech
+from h2lang.versions import VersionStore
+from check_languages import DIFFICULTIES, SectionDurations, check_data, run_scenario
+
+def full_game_totals(missions, difficulty, noarmory=False, exclude=None, speech=None):
+    # Each language's full game total, with its fastest variants, or None if
+    # the config doesn't work with this data.
+    if not check_data(missions, LineIndex({}), exclude, noarmory, speech=speech):
+        return None
+    totals = run_scenario(missions, SectionDurations(missions, speech=speech), difficulty, noarmory=noarmory,
+            exclude=exclude, out=io.StringIO())
+    _, _, durations = next(totals.all_totals(['Full Game']))
+    return {lang: totals.best('Full Game', lang)[1] for lang in durations}
+
+def _ranks(totals):
+    return {lang: rank for rank, lang in enumerate(sorted(totals, key=totals.get), 1)}
+
+def _duration(value):
+    return '{:.6f}'.format(value) if value is not None else '-'
+
+def add(args) -> int:
+    if not os.path.exists(args.archive):
+        sys.stderr.write('Path does not exist: {}\n'.format(args.archive))
+        return 1
+    missions = get_missions(args.archive, dump=False)
+    if not missions:
+        return 1
+    store = VersionStore(args.store)
+    try:
+        num_records, num_groups = store.add(args.name, missions, os.path.abspath(args.archive))
+    except KeyError as e:
+        sys.stderr.write('{}\n'.format(e.args[0]))
+        return 1
+    print('Added {} to {}: {} new sounds, {} new mission languages'.format(
+        args.name, args.store, num_records, num_groups))
+    return 0
+
+def list_versions(args) -> int:
+    store = VersionStore(args.store)
+    for name, version in store.versions.items():
+        print('{} ({}) {}'.format(name, version['digest'][:12], version['source']))
+    return 0
+
+def diff(args) -> int:
+    if args.difficulty not in DIFFICULTIES:
+        sys.stderr.write('Bad difficulty: {}\n'.format(args.difficulty))
+        return 1
+    store = VersionStore(args.store)
+    try:
+        changes = store.diff(args.old, args.new)
+    except KeyError as e:
+        sys.stderr.write('{}\n'.format(e.args[0]))
+        return 1
+
+    print(' ====== Lines changed from {} to {} ({}) ======'.format(args.old, args.new, len(changes)))
+    for change in changes:
+        delta = ' ({:+.6f})'.format(change.new - change.old) if change.old is not None and change.new is not None else ''
+        print('{} {:9s} {} {} [{}]: {} -> {}{}'.format(change.level, LANGUAGES.get(change.language, change.language),
+            change.index, change.speaker, change.variant, _duration(change.old), _duration(change.new), delta))
+
+    speech = load_speech()
+    old_totals = full_game_totals(store.missions(args.old), DIFFICULTIES[args.difficulty], args.noarmory,
+            args.exclude, speech)
+    new_totals = full_game_totals(store.missions(args.new), DIFFICULTIES[args.difficulty], args.noarmory,
+            args.exclude, speech)
+    if old_totals is None or new_totals is None:
+        return 1
+    old_ranks = _ranks(old_totals)
+    new_ranks = _ranks(new_totals)
+    print(' ====== Rankings ({}) from {} to {} ======'.format(args.difficulty, args.old, args.new))
+    for lang in sorted(set(old_ranks) | set(new_ranks), key=lambda l: (new_ranks.get(l, len(new_ranks) + 1), l)):
+        old = old_totals.get(lang)
+        new = new_totals.get(lang)
+        delta = ' ({:+.6f})'.format(new - old) if old is not None and new is not None else ''
+        print('{:9s} => #{} -> #{} (total: {} -> {}{})'.format(LANGUAGES[lang], old_ranks.get(lang, '-'),
+            new_ranks.get(lang, '-'), _duration(old), _duration(new), delta))
+    return 0
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Keep several archives in one store, and compare them.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    parser_add = subparsers.add_parser('add', help='Add an archive (or pickle) as a new version.')
+    parser_add.add_argument('store', type=str, help='Directory of the store (created if needed)')
+    parser_add.add_argument('name', type=str, help='Name of the version, e.g. xbox or mcc-2021')
+    parser_add.add_argument('archive', type=str, help='Path to the archive (or pickle)')
+    parser_add.set_defaults(func=add)
+
+    parser_list = subparsers.add_parser('list', help='List the versions in a store.')
+    parser_list.add_argument('store', type=str, help='Directory of the store')
+    parser_list.set_defaults(func=list_versions)
+
+    parser_diff = subparsers.add_parser('diff',
+            help='List the lines whose durations changed between two versions, and how the rankings shift.')
+    parser_diff.add_argument('store', type=str, help='Directory of the store')
+    parser_diff.add_argument('old', type=str, help='Name of the old version')
+    parser_diff.add_argument('new', type=str, help='Name of the new version')
+    parser_diff.add_argument('--difficulty', type=str, default='easy', help='Difficulty to rank the languages on.')
+    parser_diff.add_argument('--noarmory', help='Don\'t include armory.', action='store_true')
+    parser_diff.add_argument('--exclude', nargs='+', help='Exclude these sections from the rankings.')
+    parser_diff.set_defaults(func=diff)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import contextlib
+
+from typing import Callable, Dict
+
+from h2lang.load_data import get_missions
+from h2lang.synthetic import generate_archive, generate_old_archive, required_lines
+from config import SOUNDS_TO_CHECK, Difficulty
+from check_languages import SectionDurations, check_missions
+from h2lang.sections import section_instances
+
+def _time(func: Callable, repeat: int) -> Dict[str, float]:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        # get_missions reports everything it loads.
+        with contextlib.redirect_stdout(io.StringIO()):
+            func()
+        times.append(time.perf_counter() - start)
+    return {'best': min(times), 'mean': sum(times) / len(times), 'runs': len(times)}
+
+def _evaluate_all(missions, vectorized=False):
+    sections = SectionDurations(missions, vectorized)
+    for name, sound in SOUNDS_TO_CHECK.items():
+        for variants_to_try in section_instances(sound):
+            for difficulty in Difficulty:
+                sections.get(name, sound, variants_to_try, difficulty)
+
+def run_benchmarks(work_dir: str, num_lines: int, repeat: int) -> Dict[str, Dict[str, float]]:
+    required = required_lines(SOUNDS_TO_CHECK)
+    archive = os.path.join(work_dir, 'archive')
+    num_files = generate_archive(archive, num_lines, required=required)
+    generate_old_archive(os.path.join(work_dir, 'old-archive'), num_lines, required=required)
+    print('Generated {} sound files in {}'.format(num_files, archive))
+
+    results = {}
+    # get_missions writes its pickle and cache to the working directory.
+    os.chdir(work_dir)
+    results['ingest_cold'] = _time(lambda: get_missions(archive, rebuild=True), repeat)
+    results['ingest_cached'] = _time(lambda: get_missions(archive), repeat)
+    results['pickle_load'] = _time(lambda: get_missions('sound-data.pkl'), repeat)
+
+    missions = get_missions('sound-data.pkl')
+    results['check_missions'] = _time(lambda: check_missions(missions), repeat)
+    results['evaluate'] = _time(lambda: _evaluate_all(missions), repeat)
+
+    try:
+        from h2lang.store import write_store
+    except ImportError:
+        print('numpy is not installed, skipping the store and vectorized benchmarks')
+        return results
+    write_store(missions, 'sound-data.store')
+    results['store_load'] = _time(lambda: get_missions('sound-data.store'), repeat)
+    results['evaluate_vectorized'] = _time(lambda: _evaluate_all(missions, True), repeat)
+    return results
+
+def compare(results, baseline, threshold: float) -> int:
+    # Returns the number of benchmarks that got slower by more than `threshold`.
+    regressions = 0
+    for name, res in results.items():
+        if name not in baseline:
+            continue
+        old = baseline[name]['best']
+        ratio = res['best'] / old if old else float('inf')
+        flag = ''
+        if ratio > 1. + threshold:
+            flag = ' REGRESSION'
+            regressions += 1
+        print('{:20s} {:10.6f}s -> {:10.6f}s ({:+6.1f}%){}'.format(name, old, res['best'], (ratio - 1.) * 100, flag))
+    return regressions
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Benchmark ingest and evaluation on a synthetic archive.')
+    parser.add_argument('--lines', type=int, default=300, help='Number of lines in each level.')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of times to run each benchmark.')
+    parser.add_argument('--output', type=str, help='Write the results to this JSON file.')
+    parser.add_argument('--compare', type=str, help='Compare with the results in this JSON file.')
+    parser.add_argument('--threshold', type=float, default=0.2,
+            help='How much slower (as a fraction) counts as a regression.')
+    parser.add_argument('--keep', type=str, help='Build the archive in this directory and keep it.')
+    args = parser.parse_args()
+
+    # Resolve the paths before the benchmarks change directory.
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+
+    work_dir = os.path.abspath(args.keep) if args.keep else tempfile.mkdtemp(prefix='h2lang-bench-')
+    os.makedirs(work_dir, exist_ok=True)
+    cwd = os.getcwd()
+    try:
+        results = run_benchmarks(work_dir, args.lines, args.repeat)
+    finally:
+        os.chdir(cwd)
+        if not args.keep:
+            shutil.rmtree(work_dir)
+
+    for name, res in results.items():
+        print('{:20s} best {:10.6f}s mean {:10.6f}s'.format(name, res['best'], res['mean']))
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump({
+                'meta': {
+                    'lines': args.lines,
+                    'repeat': args.repeat,
+                    'python': platform.python_version(),
+                    'platform': platform.platform(),
+                    'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                },
+                'results': results,
+            }, f, indent=4)
+        print('Wrote results to {}'.format(output))
+
+    if baseline and compare(results, baseline, args.threshold):
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,21 +2,43 @@
 
 import os
 import sys
+import io
 import itertools
-import copy
+import heapq
+import time
+import importlib
 import argparse
 
 from typing import Tuple, List, Optional, Set, Dict
 
-from h2lang.load_data import get_missions
+from h2lang.load_data import get_missions, split_version
 from h2lang.common import Mission, LANGUAGES
 from h2lang.missions import ARMORY, MISSIONS
+from h2lang.lines import LineIndex
+from h2lang.speech import SpeechData, SPEECH_FILENAME, load_speech, special_measure, uses_speech
+from h2lang.sections import section_instances, section_fingerprint
 from config import SOUNDS_TO_CHECK, Special, Difficulty
 
+# Everything else in h2lang (routes, schedules, the result cache, outputs and
+# so on) is only imported by the options that use it, since a run that only
+# looks at a few sections is over in a fraction of a second.
+
 def check_missions(missions: Dict[str, Mission]) -> List[bool]:
     return list(map(lambda l: l.check_matching(), missions.values()))
 
-def find_durations(mission_name, indices, variants, mission, difficulty) -> Optional[Dict[str, float]]:
+def used_missions(missions: Dict[str, Mission], exclude=None, noarmory=False) -> Dict[str, Mission]:
+    # The missions that the sections being looked at come from. Missions can
+    # be loaded lazily, so the others are never touched.
+    keys = set()
+    for name, sound in SOUNDS_TO_CHECK.items():
+        if exclude and name in exclude:
+            continue
+        if sound['mission'].key == ARMORY.key and noarmory:
+            continue
+        keys.add(sound['mission'].key)
+    return {key: mission for key, mission in missions.items() if key in keys}
+
+def find_durations(mission_name, indices, variants, mission, difficulty, speech=None) -> Optional[Dict[str, float]]:
     total_durations = {}
     for code, language in mission.languages.items():
         total_dur = 0.
@@ -24,35 +46,35 @@ def find_durations(mission_name, indices, variants, mission, difficulty) -> Opti
             is_special = isinstance(idx_or_special, Special)
             idx = idx_or_special.index if is_special else idx_or_special
 
-            if idx not in language.files:
+            rows = language.rows(idx)
+            if not rows:
                 print('Invalid config: could not find sound file:', idx)
                 return None
 
-            files = language.files[idx]
-            if idx not in variants and len(files) > 1:
-                print('One of the requested sound files has multiple variants that were not specified. skipping...')
-                return None
-            if len(files) == 0:
-                # Shouldn't happen...
-                raise RuntimeError('Couldn\'t find any sound files with index: {}'.format(idx))
-
             if idx not in variants:
-                snd_file = next(iter(files))
+                if len(rows) > 1:
+                    print('One of the requested sound files has multiple variants that were not specified. skipping...')
+                    return None
+                row = rows[0]
             else:
-                snd_file = None
-                for fle in files:
-                    if fle.variant == variants[idx]:
-                        snd_file = fle
-                        break
-                if not snd_file:
+                row = language.row(idx, variants[idx])
+                if row is None:
                     print('Invalid config: invalid variant name specified: {}'.format(
                         variants[idx]))
                     return None
 
             if not is_special:
-                total_dur += snd_file.duration
+                total_dur += language.duration(row)
             else:
-                total_dur += idx_or_special.calculate(snd_file.duration, difficulty)
+                measure = special_measure(idx_or_special)
+                if measure == 'duration':
+                    value = language.duration(row)
+                else:
+                    value = speech.measure(code, language.sound(idx, row), measure) if speech else None
+                    if value is None:
+                        print('Invalid config: no {} for sound file: {}'.format(measure.replace('_', ' '), idx))
+                        return None
+                total_dur += idx_or_special.calculate(value, difficulty)
         total_durations[code] = total_dur
     return total_durations
 
@@ -70,85 +92,495 @@ def print_durations(name, durations, totals, stream=sys.stdout):
     for lang in sd:
         stream.write('{:9s} => +{:10.6f} (total:{:11.6f})\n'.format(LANGUAGES[lang], durations[lang] - fastest, durations[lang]))
 
-class VariantSet():
+class _Choice():
+    # One section with variants: each option is a combination of its variants
+    # and the times it adds to each language.
     def __init__(self):
-        # Use a list because it guarantees order, but really
-        # we should use an ordered set.
-        self._variants = []
-
-    def add_variant(self, variant):
-        self._variants.append(variant)
-
-    def has_variant(self, variant):
-        return variant in self._variants
-
-    def __str__(self):
-        return str(self._variants)
-
-DEFAULT_VARIANT = VariantSet()
+        self.options = {} # Dict[Tuple[str, ...], Dict[str, float]]
+
+    def add_option_time(self, variants_to_try, durations):
+        option = tuple(variants_to_try.values())
+        if option not in self.options:
+            self.options[option] = {}
+        for lang, dur in durations.items():
+            _add_to_totals(self.options[option], lang, dur)
+
+def _add_to_totals(lang_times, lang, dur):
+    if lang not in lang_times:
+        lang_times[lang] = 0.
+    lang_times[lang] += dur
+
+class _Category():
+    # Rather than keeping a total for every combination of variants, keep the
+    # times in the order they were added, with each section that has variants
+    # standing in for whichever option is picked. A combination's totals are
+    # only added up when they are asked for.
+    def __init__(self):
+        self._terms = [] # List[Union[Dict[str, float], int]]
+        self.choices = [] # List[_Choice]
+
+    def add_time(self, durations):
+        self._terms.append(durations)
+
+    def add_choice(self) -> _Choice:
+        self._terms.append(len(self.choices))
+        self.choices.append(_Choice())
+        return self.choices[-1]
+
+    def combinations(self):
+        return itertools.product(*[list(choice.options) for choice in self.choices])
+
+    def totals(self, combination) -> Dict[str, float]:
+        lang_times = {}
+        for term in self._terms:
+            if isinstance(term, int):
+                term = self.choices[term].options[combination[term]]
+            for lang, dur in term.items():
+                _add_to_totals(lang_times, lang, dur)
+        return lang_times
+
+    def best_combination(self, lang):
+        # Each choice is independent of the others, so the best combination
+        # is just the best option of each.
+        return tuple(min(choice.options, key=lambda o: choice.options[o].get(lang, 0.))
+                for choice in self.choices)
+
+    def top_combinations(self, lang, k):
+        # The k fastest combinations for a language, found by walking out from
+        # the best one instead of going through every combination.
+        ordered = [sorted(choice.options, key=lambda o: choice.options[o].get(lang, 0.))
+                for choice in self.choices]
+        def cost(ranks):
+            return sum(self.choices[i].options[ordered[i][r]].get(lang, 0.) for i, r in enumerate(ranks))
+        start = (0,) * len(ordered)
+        heap = [(cost(start), start)]
+        seen = {start}
+        result = []
+        while heap and len(result) < k:
+            _, ranks = heapq.heappop(heap)
+            result.append(tuple(ordered[i][r] for i, r in enumerate(ranks)))
+            for i in range(len(ranks)):
+                if ranks[i] + 1 < len(ordered[i]):
+                    nxt = ranks[:i] + (ranks[i] + 1,) + ranks[i + 1:]
+                    if nxt not in seen:
+                        seen.add(nxt)
+                        heapq.heappush(heap, (cost(nxt), nxt))
+        return result
+
+def _combination_variants(combination) -> List[str]:
+    return [variant for option in combination for variant in option]
+
+def _combination_name(combination):
+    return str(_combination_variants(combination))
 
 class LanguageTotalTracker():
     def __init__(self):
-        self._categories = {'Full Game': {DEFAULT_VARIANT: {}}}
+        self._categories = {'Full Game': _Category()}
+        self._current_choices = {}
 
-    def _add_to_totals(self, lang_times, lang, dur):
-        if lang not in lang_times:
-            lang_times[lang] = 0.
-        lang_times[lang] += dur
+    def _category(self, cat) -> _Category:
+        if cat not in self._categories:
+            self._categories[cat] = _Category()
+        return self._categories[cat]
 
     def add_time(self, mission, durations):
-        if mission not in self._categories:
-            self._categories[mission] = {DEFAULT_VARIANT: {}}
         # Add the time to all categories.
         for cat in [mission, 'Full Game']:
-            variants = self._categories[cat]
-            for variant in variants:
-                for lang, dur in durations.items():
-                    self._add_to_totals(variants[variant], lang, dur)
+            self._category(cat).add_time(durations)
 
     def add_new_variant(self, mission, variants):
-        # Duplicate all existing variants, and then add each of the new variants.
-        for cat in [mission, 'Full Game']:
-            new_totals = {}
-            old_totals = self._categories[cat]
-            for existing_variant in old_totals:
-                for new_variants in variants.values():
-                    for new_variant in new_variants:
-                        old_stuff = copy.deepcopy(old_totals[existing_variant])
-                        new_vk = copy.deepcopy(existing_variant)
-                        new_vk.add_variant(new_variant)
-                        new_totals[new_vk] = old_stuff
-            self._categories[cat] = new_totals
+        # Each section with variants becomes one more independent choice.
+        self._current_choices[mission] = [self._category(cat).add_choice() for cat in [mission, 'Full Game']]
 
     def add_variant_time(self, mission, variants_to_try, durations):
-        if mission not in self._categories:
-            self._categories[mission] = {DEFAULT_VARIANT: {}}
         # Add the time to a specific variant.
-        for cat in [mission, 'Full Game']:
-            variants = self._categories[cat]
-            num_added = 0
-            num_missed = 0
-            for variant in variants:
-                for lang, dur in durations.items():
-                    for var_val in variants_to_try.values():
-                        if variant.has_variant(var_val):
-                            self._add_to_totals(variants[variant], lang, dur)
-                            num_added += 1
-                        else:
-                            num_missed += 1
-            if num_added != num_missed:
-                raise RuntimeError('Bad total counting: {} {}'.format(num_added, num_missed))
-    def print_out(self, stderr=False):
-        if not stderr:
-            sys.stdout.write(' ========== TOTALS ========== \n')
-        stream = sys.stderr if stderr else sys.stdout
-        for cat in self._categories:
+        for choice in self._current_choices[mission]:
+            choice.add_option_time(variants_to_try, durations)
+
+    def best(self, cat, lang) -> Tuple[str, float]:
+        variants, total = self.best_variants(cat, lang)
+        return str(variants), total
+
+    def best_variants(self, cat, lang) -> Tuple[List[str], float]:
+        # The variants of the fastest combination for `lang`, and its total.
+        category = self._categories[cat]
+        combination = category.best_combination(lang)
+        return _combination_variants(combination), category.totals(combination)[lang]
+
+    def top(self, cat, lang, k) -> List[Tuple[str, float]]:
+        category = self._categories[cat]
+        return [(_combination_name(c), category.totals(c)[lang]) for c in category.top_combinations(lang, k)]
+
+    def all_totals(self, cats=None):
+        # (category, combination name or None, totals) for every combination
+        # of variants of each category.
+        for cat, variants, durations in self.all_variant_totals(cats):
+            yield cat, str(variants) if variants else None, durations
+
+    def all_variant_totals(self, cats=None):
+        # The same, with the list of variants of each combination (empty for
+        # a category without any).
+        for cat, category in self._categories.items():
+            if cats is not None and cat not in cats:
+                continue
+            for combination in category.combinations():
+                yield cat, _combination_variants(combination), category.totals(combination)
+
+    def mission_totals(self) -> Dict[str, Dict[str, float]]:
+        # Each mission's totals, with the variants that are fastest for each
+        # language.
+        result = {}
+        for cat, category in self._categories.items():
+            if cat == 'Full Game':
+                continue
+            languages = category.totals(next(category.combinations()))
+            result[cat] = {lang: category.totals(category.best_combination(lang))[lang] for lang in languages}
+        return result
+
+    def print_out(self, stream=sys.stdout, header=True):
+        if header:
+            stream.write(' ========== TOTALS ========== \n')
+        for cat, combination_name, durations in self.all_totals():
             real_name = MISSIONS[cat].name if cat in MISSIONS else cat
-            for variant, durations in self._categories[cat].items():
-                if variant != DEFAULT_VARIANT:
-                    print_durations('{} [variant={}]'.format(real_name, variant), durations, True, stream)
-                else:
-                    print_durations(real_name, durations, True, stream)
+            if combination_name:
+                print_durations('{} [variant={}]'.format(real_name, combination_name), durations, True, stream)
+            else:
+                print_durations(real_name, durations, True, stream)
+
+    def print_top(self, k, stream=sys.stdout):
+        for cat, category in self._categories.items():
+            if not category.choices:
+                continue
+            real_name = MISSIONS[cat].name if cat in MISSIONS else cat
+            for lang in LANGUAGES:
+                if lang not in category.totals(category.best_combination(lang)):
+                    continue
+                stream.write(' ====== {}: fastest variants for {} ======\n'.format(real_name, LANGUAGES[lang]))
+                for name, total in self.top(cat, lang, k):
+                    stream.write('{:11.6f} {}\n'.format(total, name))
+
+DIFFICULTIES = {
+        'easy': Difficulty.EASY,
+        'normal': Difficulty.NORMAL,
+        'heroic': Difficulty.HEROIC,
+        'legendary': Difficulty.LEGENDARY,
+}
+
+class SectionDurations():
+    # Works out the durations of each section once, so that they can be shared
+    # by every scenario that is run on the same data. Durations are kept by
+    # the section's fingerprint, so after config.py is reloaded only the
+    # sections that changed are worked out again, and they can also be kept
+    # in a ResultCache from one run to the next.
+    def __init__(self, missions, vectorized=False, results: Optional['ResultCache'] = None,
+            version: Optional['DataVersion'] = None, speech: Optional[SpeechData] = None):
+        self._missions = missions
+        self.speech = speech
+        self._durations = {}
+        self._compiled = None
+        self._vectorized = vectorized
+        self._results = results
+        self._version = version
+        self.num_computed = 0
+
+    def save(self):
+        if self._results is not None:
+            self._results.save()
+
+    def config_changed(self):
+        # The vectorized engine works out every section at once, so it has to
+        # compile SOUNDS_TO_CHECK again the next time anything is needed.
+        self._compiled = None
+        # Drop the durations of sections that were changed or removed, which
+        # would otherwise pile up over a long --watch.
+        current = {(name, section_fingerprint(sound)) for name, sound in SOUNDS_TO_CHECK.items()}
+        self._durations = {key: durations for key, durations in self._durations.items() if key[:2] in current}
+
+    def compiled(self):
+        # The sections compiled for the vectorized engine, which only needs
+        # numpy when it is asked for.
+        if not self._compiled:
+            from h2lang.engine import compile_sections, evaluate
+            self._compiled = compile_sections(SOUNDS_TO_CHECK, self._missions, list(Difficulty), self.speech)
+            self.section_totals = evaluate(self._compiled)
+        return self._compiled
+
+    def _find_durations(self, name, sound, variants_to_try, difficulty) -> Optional[Dict[str, float]]:
+        self.num_computed += 1
+        if self._vectorized:
+            return self.compiled().section_durations(self.section_totals, name, variants_to_try, difficulty)
+        mission_id = sound['mission']
+        return find_durations(mission_id.key, sound['indices'], variants_to_try,
+                self._missions[mission_id.key], difficulty, self.speech)
+
+    def get(self, name, sound, variants_to_try, difficulty) -> Optional[Dict[str, float]]:
+        fingerprint = section_fingerprint(sound)
+        variant_key = tuple(sorted(variants_to_try.items()))
+        key = (name, fingerprint, variant_key, difficulty.name)
+        if key not in self._durations:
+            durations = None
+            if self._results is not None:
+                version = self._version.mission(sound['mission'].key) if self._version else None
+                if uses_speech(sound):
+                    version = (version, self.speech.version if self.speech else None)
+                result_key = (version, fingerprint, variant_key, difficulty.name)
+                durations = self._results.get(result_key)
+            if durations is None:
+                durations = self._find_durations(name, sound, variants_to_try, difficulty)
+                if self._results is not None and durations is not None:
+                    self._results.put(result_key, durations)
+            self._durations[key] = durations
+        return self._durations[key]
+
+def scenario_sections(noarmory=False, exclude=None):
+    # The sections that go into a scenario's breakdown, in order.
+    for name, sound in SOUNDS_TO_CHECK.items():
+        if exclude and name in exclude:
+            continue
+        if name.startswith('SKIP'):
+            continue
+        if sound['mission'].key == ARMORY.key and noarmory:
+            continue
+        yield name, sound
+
+def run_scenario(missions, sections: SectionDurations, difficulty, noarmory=False, exclude=None,
+        global_no_totaling=False, out=sys.stdout, totals_out=None, top=0):
+    # Writes the breakdown of every section to `out`, and the totals to
+    # `totals_out` (or to the end of `out`). Returns the totals.
+    language_totals = LanguageTotalTracker()
+    for name, sound in scenario_sections(noarmory, exclude):
+        mission_id = sound['mission']
+        variants = sound.get('variants')
+        nototal = sound.get('nototal')
+        if mission_id.key not in missions:
+            print_name(name, not nototal, out)
+            out.write('ERROR: Bad config: {}, mission not found\n'.format(name))
+            continue
+
+        do_totaling = not (global_no_totaling or nototal)
+
+        if not variants:
+            durations = sections.get(name, sound, {}, difficulty)
+            print_durations(name, durations, do_totaling, out)
+            if do_totaling:
+                language_totals.add_time(mission_id.key, durations)
+        if variants:
+            if do_totaling:
+                language_totals.add_new_variant(mission_id.key, variants)
+
+            for instance in itertools.product(*variants.values()):
+                variants_to_try = dict(zip(variants.keys(), instance))
+                durations = sections.get(name, sound, variants_to_try, difficulty)
+                print_durations('{} [variant={}]'.format(name, variants_to_try), durations, do_totaling, out)
+                if do_totaling:
+                    language_totals.add_variant_time(mission_id.key, variants_to_try, durations)
+
+    if not global_no_totaling:
+        if totals_out:
+            language_totals.print_out(totals_out, header=False)
+        else:
+            language_totals.print_out(out)
+        if top:
+            language_totals.print_top(top, totals_out or out)
+    return language_totals
+
+def build_routes(missions, sections: SectionDurations, difficulty, noarmory=False, exclude=None) -> 'RouteOptimizer':
+    # Every section counts towards the route's total, apart from the optional
+    # ones, sections with variants, and groups of alternatives, which each
+    # become a choice.
+    from h2lang.routes import RouteOptimizer, Choice
+
+    fixed = {}
+    choices = []
+    alternatives = {}
+    for name, sound in SOUNDS_TO_CHECK.items():
+        if exclude and name in exclude:
+            continue
+        mission_id = sound['mission']
+        if mission_id.key == ARMORY.key and noarmory:
+            continue
+        if mission_id.key not in missions:
+            continue
+        group = sound.get('alternatives')
+        if not group and (name.startswith('SKIP') or sound.get('nototal')):
+            continue
+
+        options = []
+        for variants_to_try in section_instances(sound):
+            label = '{} [variant={}]'.format(name, variants_to_try) if variants_to_try else None
+            options.append((label, sections.get(name, sound, variants_to_try, difficulty)))
+        if group:
+            alternatives.setdefault(group, []).extend((label or name, durations) for label, durations in options)
+            continue
+        if sound.get('optional'):
+            options.append(('skip {}'.format(name), {lang: 0. for lang in options[0][1]}))
+
+        if len(options) > 1:
+            choices.append(Choice(name, options))
+        else:
+            for lang, dur in options[0][1].items():
+                _add_to_totals(fixed, lang, dur)
+
+    for group, options in alternatives.items():
+        choices.append(Choice(group, options))
+    return RouteOptimizer(fixed, choices)
+
+def print_routes(routes: 'RouteOptimizer', stream=sys.stdout):
+    num_routes = 1
+    for choice in routes.choices:
+        num_routes *= len(choice.options)
+    stream.write(' ====== Routes ({} choices, {} routes) ======\n'.format(len(routes.choices), num_routes))
+
+    fastest = routes.fastest_route()
+    stream.write('Fastest route: {} (total:{:11.6f}), +{:.6f} over {}: {}\n'.format(
+        LANGUAGES[fastest.language], fastest.total, fastest.margin, LANGUAGES[fastest.runner_up],
+        ', '.join(routes.labels(fastest.route)) or '-'))
+
+    # For each language, the route where it is furthest ahead. A negative
+    # margin means that it is never the fastest.
+    results = [routes.best_margin(lang) for lang in routes.languages]
+    for res in sorted(results, key=lambda r: -r.margin):
+        stream.write('{:9s} => {:+11.6f} over {:9s} (total:{:11.6f}): {}\n'.format(
+            LANGUAGES[res.language], res.margin, LANGUAGES[res.runner_up], res.total,
+            ', '.join(routes.labels(res.route)) or '-'))
+
+def scenario_inputs(missions, scenario, version: Optional['DataVersion'], speech: Optional[SpeechData] = None) -> Dict:
+    # Everything a scenario's files are worked out from, for the manifest.
+    noarmory = scenario.get('noarmory', False)
+    exclude = scenario.get('exclude')
+    inputs = {
+        'data': version.of(sound['mission'].key for _, sound in scenario_sections(noarmory, exclude)
+            if sound['mission'].key in missions) if version else None,
+        'difficulty': DIFFICULTIES[scenario['difficulty']].name,
+        'noarmory': noarmory,
+        'exclude': exclude,
+        'totals_separate': bool(scenario.get('totals')),
+        'sections': [[name, section_fingerprint(sound) if sound['mission'].key in missions else None,
+            bool(sound.get('nototal'))] for name, sound in scenario_sections(noarmory, exclude)],
+    }
+    if speech and any(uses_speech(sound) for _, sound in scenario_sections(noarmory, exclude)):
+        inputs['speech'] = speech.version
+    return inputs
+
+def run_schedule(missions, sections: SectionDurations, switch_cost: float, noarmory=False, exclude=None,
+        stream=sys.stdout):
+    # The best language for each mission on every difficulty, when changing
+    # language between missions costs `switch_cost` seconds.
+    from h2lang.schedule import best_schedule
+
+    for difficulty_name, difficulty in DIFFICULTIES.items():
+        totals = run_scenario(missions, sections, difficulty, noarmory=noarmory, exclude=exclude, out=io.StringIO())
+        schedule = best_schedule(totals.mission_totals(), switch_cost)
+        stream.write(' ====== Schedule ({}, {:.6f} per switch) ======\n'.format(difficulty_name, switch_cost))
+        if not schedule:
+            stream.write('Nothing to schedule\n')
+            continue
+        for mission, lang in zip(schedule.missions, schedule.languages):
+            stream.write('{:17s} => {}\n'.format(MISSIONS[mission].name, LANGUAGES[lang]))
+        stream.write('Total:{:11.6f} with {} switches, {:.6f} faster than {} alone (total:{:11.6f})\n'.format(
+            schedule.total, schedule.switches, schedule.saved, LANGUAGES[schedule.single_language],
+            schedule.single_total))
+
+def run_sensitivity(missions, sections: SectionDurations, difficulty, samples: int, seed=None,
+        noarmory=False, exclude=None, stream=sys.stdout):
+    # How likely each language is to be the fastest over the whole game, going
+    # by the jitter and probability of the lines in config.py.
+    from h2lang.montecarlo import SensitivityModel
+
+    totalled = [(name, sound) for name, sound in scenario_sections(noarmory, exclude)
+        if sound['mission'].key in missions and not sound.get('nototal')]
+    model = SensitivityModel(sections.compiled(), totalled, difficulty)
+    if not model.num_uncertain:
+        stream.write(' ====== Sensitivity ======\n')
+        stream.write('Nothing is uncertain: none of the lines counted on {} has a jitter or probability '
+            '(see Special in config.py)\n'.format(difficulty.name.lower()))
+        return
+    start = time.perf_counter()
+    results = model.run(samples, seed)
+    stream.write(' ====== Sensitivity ({} samples in {:.1f} s) ======\n'.format(samples, time.perf_counter() - start))
+    for res in sorted(results, key=lambda r: (-r.fastest, r.mean)):
+        stream.write('{:9s} => fastest: {:6.2f}% mean:{:12.6f} 95%: {:11.6f} to {:11.6f}\n'.format(
+            LANGUAGES[res.language], res.fastest * 100, res.mean, res.low, res.high))
+
+def run_sweep(missions, sections: SectionDurations, filename: str, toggled: List[str], exclude=None,
+        jobs: int = 1) -> int:
+    # The full game totals of every difficulty, with and without the armory,
+    # with every subset of `toggled` excluded, and every combination of
+    # variants, as a CSV file.
+    from h2lang.sweep import Sweep
+
+    totalled = [(name, sound) for name, sound in scenario_sections(exclude=exclude)
+        if sound['mission'].key in missions and not sound.get('nototal')]
+    sweep = Sweep(sections.compiled(), sections.section_totals, totalled, ARMORY.key, toggled)
+    start = time.perf_counter()
+    with open(filename, 'w', newline='') as f:
+        num_rows = sweep.write_csv(f, jobs)
+    print('Wrote {} rows for {} scenarios to {} in {:.1f} s'.format(
+        num_rows, len(sweep.units()), filename, time.perf_counter() - start))
+    return 0
+
+def run_batch(missions, sections: SectionDurations, filename: str, version: Optional['DataVersion'] = None,
+        dry_run=False, force=False) -> int:
+    # The scenario file is a JSON list of objects with a difficulty, and
+    # optionally noarmory, exclude, and the files to write the breakdown and
+    # totals to (relative to the scenario file). Files whose inputs haven't
+    # changed since they were written (see the manifest next to the scenario
+    # file) are left alone, unless `force`.
+    import json
+    from h2lang.outputs import OutputManifest, MANIFEST_FILENAME, write_if_changed
+
+    with open(filename) as f:
+        scenarios = json.load(f)
+    base_dir = os.path.dirname(filename)
+    manifest = OutputManifest(os.path.join(base_dir, MANIFEST_FILENAME))
+
+    num_files = 0
+    num_written = 0
+    for scenario in scenarios:
+        if scenario['difficulty'] not in DIFFICULTIES:
+            sys.stderr.write('Bad difficulty: {}\n'.format(scenario['difficulty']))
+            return 1
+        paths = [os.path.join(base_dir, scenario[k]) if scenario.get(k) else None for k in ('breakdown', 'totals')]
+        breakdown_path, totals_path = paths
+        inputs = scenario_inputs(missions, scenario, version, sections.speech)
+        num_files += sum(1 for p in paths if p)
+
+        if breakdown_path:
+            stale = {p: ['forced'] if force else manifest.changes(p, inputs) for p in paths if p}
+            stale = {p: reasons for p, reasons in stale.items() if reasons}
+            if not stale:
+                continue
+            if dry_run:
+                for path, reasons in stale.items():
+                    print('Would write: {} ({})'.format(path, '; '.join(reasons)))
+                num_written += len(stale)
+                continue
+        elif dry_run:
+            continue
+
+        out = io.StringIO() if breakdown_path else sys.stdout
+        totals_out = io.StringIO() if totals_path else None
+        run_scenario(missions, sections, DIFFICULTIES[scenario['difficulty']],
+                noarmory=scenario.get('noarmory', False), exclude=scenario.get('exclude'),
+                out=out, totals_out=totals_out)
+        written = []
+        for path, stream in zip(paths, (out, totals_out)):
+            if not path:
+                continue
+            text = stream.getvalue()
+            if write_if_changed(path, text):
+                written.append(path)
+            manifest.record(path, inputs, text)
+        if written:
+            print('Wrote: {}'.format(', '.join(written)))
+        num_written += len(written)
+
+    if dry_run:
+        print('{} of {} files would be written'.format(num_written, num_files))
+    else:
+        manifest.save()
+        print('Wrote {} of {} files'.format(num_written, num_files))
+    return 0
 
 def main() -> int:
     parser = argparse.ArgumentParser(description='Process halo timing differences.')
@@ -158,82 +590,265 @@ def main() -> int:
     parser.add_argument('--difficulty', type=str, default='easy', help='Specify the difficulty.')
     parser.add_argument('--exclude', nargs='+',
             help='Exclude a particular section from analysis (e.g., if doing Arbiter Glass Clip, it shouldn\'t be included.')
+    parser.add_argument('--sections', nargs='+',
+            help='Only analyse these sections.')
     parser.add_argument('--stderrtotals', default=False, action='store_true',
             help='Write totals to stderr.')
+    parser.add_argument('--jobs', type=int, default=1,
+            help='Number of processes to use when reading an extracted archive, or for --sweep (which only uses '
+                 'them for 4096 or more scenarios, e.g. nine or more --sweep-exclude sections).')
+    parser.add_argument('--io-threads', type=int, default=0,
+            help='Read an extracted archive with this many reads in flight at once (for slow network mounts). '
+                 'Can\'t be used with --jobs, except for --sweep.')
+    parser.add_argument('--rebuild', default=False, action='store_true',
+            help='Ignore the ingest cache and read every sound file in the archive again.')
+    parser.add_argument('--trust-dirs', default=False, action='store_true',
+            help='Don\'t check the cached sound files in directories whose size and modification time haven\'t '
+                 'changed (faster, but misses files that were overwritten in place).')
+    parser.add_argument('--vectorized', default=False, action='store_true',
+            help='Work out every section at once with numpy instead of one at a time.')
+    parser.add_argument('--top', type=int, default=0,
+            help='Also list the N fastest variant combinations for each language.')
+    parser.add_argument('--optimize', default=False, action='store_true',
+            help='Search the optional sections, variants and alternatives for the best route for each language.')
+    parser.add_argument('--sensitivity', type=int, default=0, metavar='SAMPLES',
+            help='Estimate how likely each language is to be the fastest from this many random samples of the '
+                 'uncertain lines (see Special in config.py), on each language\'s fastest variants (needs numpy).')
+    parser.add_argument('--seed', type=int, default=0,
+            help='Random seed for --sensitivity.')
+    parser.add_argument('--schedule', type=float, metavar='SWITCH_COST',
+            help='Find the best language to play each mission in on every difficulty, when changing language '
+                 'between missions takes this many seconds.')
+    parser.add_argument('--sweep', type=str, metavar='FILE',
+            help='Write the full game totals of every difficulty, with and without the armory, every subset of '
+                 '--sweep-exclude and every combination of variants to this CSV file (needs numpy).')
+    parser.add_argument('--sweep-exclude', nargs='+',
+            help='The sections to try both with and without in --sweep (the optional ones by default).')
+    parser.add_argument('--batch', type=str,
+            help='Run every scenario in a scenario file (see scenarios.json) instead of a single one.')
+    parser.add_argument('--dry-run', default=False, action='store_true',
+            help='With --batch, only list the files that would be written, and why.')
+    parser.add_argument('--force', default=False, action='store_true',
+            help='With --batch, work out every file again, even the ones that are up to date.')
+    parser.add_argument('--result-cache', type=str, metavar='FILE',
+            help='Keep the durations of every section in this file between runs (e.g. results-cache.pkl), so that '
+                 'only new or changed sections are worked out.')
+    parser.add_argument('--cache-stats', default=False, action='store_true',
+            help='With --result-cache, write how many durations came from it to stderr.')
+    parser.add_argument('--watch', default=False, action='store_true',
+            help='Keep the data loaded, and print everything again whenever config.py changes.')
+    parser.add_argument('--profile', default=False, action='store_true',
+            help='Write the time, calls and peak memory of each stage to stderr when done.')
+    parser.add_argument('--profile-json', type=str,
+            help='Write the same as --profile to this JSON file.')
     args = parser.parse_args()
 
-    if args.difficulty == 'easy':
-        difficulty = Difficulty.EASY
-    elif args.difficulty == 'normal':
-        difficulty = Difficulty.NORMAL
-    elif args.difficulty == 'heroic':
-        difficulty = Difficulty.HEROIC
-    elif args.difficulty == 'legendary':
-        difficulty = Difficulty.LEGENDARY
+    if not args.profile and not args.profile_json:
+        return run(args)
+
+    from h2lang.profiling import Profiler
+
+    profiler = Profiler()
+    profiler.install()
+    namespace = globals()
+    for name in ('get_missions', 'find_durations', 'print_name', 'print_durations', 'print_routes'):
+        profiler.patch(namespace, name, name)
+    for method in ('add_time', 'add_new_variant', 'add_variant_time'):
+        profiler.patch(LanguageTotalTracker, method, 'totaling')
+    profiler.patch(LanguageTotalTracker, 'print_out', 'print totals')
+    profiler.patch(LineIndex, '__init__', 'line index')
+    profiler.patch(LineIndex, 'mismatches', 'check missions')
+    profiler.patch(LineIndex, 'validate', 'validate config')
+    if args.vectorized:
+        from h2lang import engine
+        profiler.patch(engine, 'compile_sections', 'compile_sections')
+        profiler.patch(engine, 'evaluate', 'evaluate')
+    try:
+        return run(args)
+    finally:
+        profiler.uninstall()
+        if args.profile:
+            profiler.print_out(sys.stderr)
+        if args.profile_json:
+            profiler.write_json(args.profile_json)
+
+# How often --watch looks at config.py, in seconds.
+WATCH_INTERVAL = 0.1
+
+def reload_config():
+    # Everything that comes from config.py has to be replaced, including the
+    # classes: a reloaded Special or Difficulty is a different class.
+    global SOUNDS_TO_CHECK, Special, Difficulty, DIFFICULTIES
+    config = importlib.reload(sys.modules['config'])
+    SOUNDS_TO_CHECK = config.SOUNDS_TO_CHECK
+    Special = config.Special
+    Difficulty = config.Difficulty
+    DIFFICULTIES = {name: Difficulty[difficulty.name] for name, difficulty in DIFFICULTIES.items()}
+
+def scenario_exclude(args) -> Tuple[bool, Optional[List[str]]]:
+    exclude = args.exclude
+    if args.sections:
+        unknown = [name for name in args.sections if name not in SOUNDS_TO_CHECK]
+        if unknown:
+            sys.stderr.write('Unknown sections: {}\n'.format(', '.join(unknown)))
+            return False, None
+        exclude = (exclude or []) + [name for name in SOUNDS_TO_CHECK if name not in args.sections]
+    return True, exclude
+
+def check_data(missions, lines: LineIndex, exclude, noarmory, batch=False, speech: Optional[SpeechData] = None) -> bool:
+    # Makes sure that there are no mismatched files in anything that is used,
+    # and that every section is valid. Missions are added to `lines` (and
+    # checked) the first time they are used.
+    if batch:
+        used = used_missions(missions)
     else:
+        used = used_missions(missions, exclude, noarmory)
+    mismatched = False
+    for key, mission in used.items():
+        if key in lines.languages:
+            continue
+        lines.add_mission(key, mission)
+        problems = lines.mismatches(key)
+        if problems:
+            mismatched = True
+            sys.stderr.write('Missions mismatched: {}\n'.format(key))
+            for problem in problems:
+                sys.stderr.write('    {}\n'.format(problem))
+    if mismatched:
+        return False
+
+    # Find every problem with the config before working anything out.
+    skip = None if batch else exclude
+    problems = lines.validate(SOUNDS_TO_CHECK, skip)
+    if any(uses_speech(sound) for name, sound in SOUNDS_TO_CHECK.items() if not skip or name not in skip):
+        if speech is None:
+            problems.append('lines are measured by their speech, but there is no {} (see analyze_speech.py)'.format(
+                SPEECH_FILENAME))
+        else:
+            problems.extend(speech.validate(SOUNDS_TO_CHECK, missions, skip))
+    if problems:
+        for problem in problems:
+            sys.stderr.write('Invalid config: {}\n'.format(problem))
+        return False
+    return True
+
+def watch(args, missions, lines: LineIndex, sections: SectionDurations) -> int:
+    # Prints the breakdown, and again whenever config.py changes.
+    path = sys.modules['config'].__file__
+    mtime = None
+    try:
+        while True:
+            try:
+                new_mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                # It can briefly disappear while an editor saves it.
+                new_mtime = mtime
+            if new_mtime != mtime:
+                start = time.perf_counter()
+                reloaded = True
+                if mtime is not None:
+                    try:
+                        reload_config()
+                        sections.config_changed()
+                    except Exception as e:
+                        sys.stderr.write('Could not reload {}: {}\n'.format(path, e))
+                        reloaded = False
+                mtime = new_mtime
+                ok, exclude = scenario_exclude(args)
+                if reloaded and ok and check_data(missions, lines, exclude, args.noarmory, speech=sections.speech):
+                    num_computed = sections.num_computed
+                    run_scenario(missions, sections, DIFFICULTIES[args.difficulty], noarmory=args.noarmory,
+                            exclude=exclude, global_no_totaling=args.nototaling,
+                            totals_out=sys.stderr if args.stderrtotals else None, top=args.top)
+                    sections.save()
+                    sys.stdout.flush()
+                    sys.stderr.write('Worked out {} section durations in {:.1f} ms, watching {}\n'.format(
+                        sections.num_computed - num_computed, (time.perf_counter() - start) * 1000, path))
+            time.sleep(WATCH_INTERVAL)
+    except KeyboardInterrupt:
+        return 0
+
+def run(args) -> int:
+    if args.difficulty not in DIFFICULTIES:
         sys.stderr.write('Bad difficulty: {}\n'.format(args.difficulty))
         return 1
-
-    noarmory = args.noarmory
-    global_no_totaling = args.nototaling
+    difficulty = DIFFICULTIES[args.difficulty]
+    # Both say how to read an extracted archive, and --io-threads would win.
+    if args.io_threads > 0 and args.jobs > 1 and not args.sweep:
+        sys.stderr.write('--io-threads and --jobs can\'t be used together (except with --sweep)\n')
+        return 1
 
     archive = args.archive
 
-    if not os.path.exists(archive):
-        sys.stderr.write('Path does not exist: {}\n'.format(arhive))
+    # A version in a versions store is <dir>@<name>.
+    if not os.path.exists(split_version(archive)[0]):
+        sys.stderr.write('Path does not exist: {}\n'.format(archive))
         return 1
 
-    missions = get_missions(archive)
+    missions = get_missions(archive, jobs=args.jobs, rebuild=args.rebuild, trust_dirs=args.trust_dirs,
+            io_threads=args.io_threads)
 
     if not missions:
         return 1
 
-    # Make sure that there are no mismatched files.
-    passed = check_missions(missions)
-    if not all(passed):
-        for i, l in enumerate(missions):
-            if not passed[i]:
-                sys.stderr.write('Missions mismatched: {}\n'.format(l))
+    ok, exclude = scenario_exclude(args)
+    if not ok:
         return 1
 
-    language_totals = LanguageTotalTracker()
-    for name, sound in SOUNDS_TO_CHECK.items():
-        if args.exclude and name in args.exclude:
-            continue
-        if name.startswith('SKIP'):
-            continue
-        mission_id = sound['mission']
-        if mission_id.key == ARMORY.key and noarmory:
-            continue
-        indices = sound['indices']
-        variants = sound.get('variants')
-        nototal = sound.get('nototal')
-        if mission_id.key not in missions:
-            print_name(name, not nototal)
-            print('ERROR: Bad config: {}, mission not found'.format(name))
-            continue
-
-        do_totaling = not (global_no_totaling or nototal)
-
-        mission = missions[mission_id.key]
-        if not variants:
-            durations = find_durations(mission_id.key, indices, {}, mission, difficulty)
-            print_durations(name, durations, do_totaling)
-            if do_totaling:
-                language_totals.add_time(mission_id.key, durations)
-        if variants:
-            if do_totaling:
-                language_totals.add_new_variant(mission_id.key, variants)
-
-            for instance in itertools.product(*variants.values()):
-                variants_to_try = dict(zip(variants.keys(), instance))
-                durations = find_durations(mission_id.key, indices, variants_to_try, mission, difficulty)
-                print_durations('{} [variant={}]'.format(name, variants_to_try), durations, do_totaling)
-                if do_totaling:
-                    language_totals.add_variant_time(mission_id.key, variants_to_try, durations)
+    speech = load_speech()
+    lines = LineIndex({})
+    if not check_data(missions, lines, exclude, args.noarmory, args.batch or args.sweep, speech):
+        return 1
 
-    if do_totaling:
-        language_totals.print_out(args.stderrtotals)
+    results = None
+    version = None
+    if args.result_cache or args.batch:
+        from h2lang.results import ResultCache, DataVersion
+        if args.result_cache:
+            results = ResultCache(args.result_cache)
+        # Only worked out for the missions that are asked for, when they are.
+        version = DataVersion(missions)
+    sections = SectionDurations(missions, args.vectorized, results, version, speech)
+    try:
+        return evaluate(args, missions, lines, sections, difficulty, exclude, version)
+    finally:
+        sections.save()
+        if results is not None and args.cache_stats:
+            sys.stderr.write('Result cache: {} hits, {} misses, {} results kept\n'.format(
+                results.hits, results.misses, len(results)))
+
+def evaluate(args, missions, lines: LineIndex, sections: SectionDurations, difficulty, exclude,
+        version: Optional['DataVersion'] = None) -> int:
+    if args.batch:
+        return run_batch(missions, sections, args.batch, version, dry_run=args.dry_run, force=args.force)
+
+    if args.watch:
+        return watch(args, missions, lines, sections)
+
+    if args.sweep:
+        toggled = args.sweep_exclude or [name for name, sound in SOUNDS_TO_CHECK.items() if sound.get('optional')]
+        unknown = [name for name in toggled if name not in SOUNDS_TO_CHECK]
+        if unknown:
+            sys.stderr.write('Unknown sections: {}\n'.format(', '.join(unknown)))
+            return 1
+        return run_sweep(missions, sections, args.sweep, toggled, exclude, args.jobs)
+
+    if args.schedule is not None:
+        run_schedule(missions, sections, args.schedule, noarmory=args.noarmory, exclude=exclude)
+        return 0
+
+    if args.sensitivity:
+        run_sensitivity(missions, sections, difficulty, args.sensitivity, args.seed, noarmory=args.noarmory,
+                exclude=exclude)
+        return 0
+
+    if args.optimize:
+        print_routes(build_routes(missions, sections, difficulty, noarmory=args.noarmory, exclude=exclude))
+        return 0
+
+    run_scenario(missions, sections, difficulty, noarmory=args.noarmory, exclude=exclude,
+            global_no_totaling=args.nototaling, totals_out=sys.stderr if args.stderrtotals else None,
+            top=args.top)
 
     return 0
 
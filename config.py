@@ -14,19 +14,59 @@ LEGENDARY = Difficulty.LEGENDARY
 
 ALL_DIFFICULTIES = {EASY, NORMAL, HEROIC, LEGENDARY}
 
+# A line that is only counted on some difficulties, or that we don't wait for
+# the whole of. Its time is max(0, scale * duration + offset), or func(duration)
+# for anything that isn't a straight line. With measure='speech_end' (or
+# 'speech_start'), `duration` is when the speech in each language's recording
+# ends (or starts) instead, as found by analyze_speech.py.
+#
+# How sure we are about a line only matters to --sensitivity: `jitter` is the
+# standard deviation (in seconds) of a normally distributed error in its time,
+# and `probability` is the chance that we really wait for it at all.
+MEASURES = ('duration', 'speech_start', 'speech_end')
+
 class Special:
-    def __init__(self, index, func=None, difficulties=ALL_DIFFICULTIES):
+    def __init__(self, index, func=None, difficulties=ALL_DIFFICULTIES, scale=1., offset=0., measure='duration',
+            jitter=0., probability=1.):
+        if measure not in MEASURES:
+            raise ValueError('unknown measure: {}'.format(measure))
         self._func = func
         self.index = index
         self._difficulties = difficulties
+        self.scale = scale
+        self.offset = offset
+        self.measure = measure
+        self.jitter = jitter
+        self.probability = probability
+
+    def __hash__(self):
+        # By default a Special hashes by its address, so a set of lines with one
+        # in it comes out in a different order (and is added up in a different
+        # order, with different rounding) every run.
+        return hash(self.index)
+
+    def __eq__(self, other):
+        # Two Specials are the same line only if they are counted the same
+        # way, which also keeps equal ones hashing the same.
+        if not isinstance(other, Special):
+            return NotImplemented
+        return ((self.index, self._func, self._difficulties, self.scale, self.offset, self.measure,
+                self.jitter, self.probability) ==
+            (other.index, other._func, other._difficulties, other.scale, other.offset, other.measure,
+                other.jitter, other.probability))
 
     def calculate(self, duration, difficulty):
         if difficulty not in self._difficulties:
             return 0
         if self._func:
             return self._func(duration)
-        return duration
+        return max(0, self.scale * duration + self.offset)
 
+# Besides 'mission' and 'indices', a section can have:
+#   'variants':     the sound files to try for indices with more than one.
+#   'nototal':      don't add the section to the totals.
+#   'optional':     the section can be skipped (see --exclude and --optimize).
+#   'alternatives': a name shared by sections of which exactly one is done.
 SOUNDS_TO_CHECK = {
     'armory_training_look': {
         'mission': ARMORY,
@@ -77,7 +117,7 @@ SOUNDS_TO_CHECK = {
         'mission': ARMORY,
         'indices': {
             # Don't worry, I'll hold his hand.
-            Special(1040, lambda dur: max(0, dur - 1)),
+            Special(1040, offset=-1),
 
             3360, # So Johnson, ... in one piece?
             990, # Sorry, Guns. It's classified. 
@@ -87,7 +127,7 @@ SOUNDS_TO_CHECK = {
         'mission': ARMORY,
         'indices': {
             # Earth. Haven't seen it in years.
-            Special(10, lambda dur: max(0, dur - 1))
+            Special(10, offset=-1)
         },
     },
     'cairo_malta': {
@@ -96,7 +136,8 @@ SOUNDS_TO_CHECK = {
             200, # Hey, check it out. ... boarders.
             210, # Malta, what's your status, over?
             220, # I don't believe it. ... We won!
-        }
+        },
+        'optional': True, # Hangar 1 skip.
     },
     'cairo_athens': {
         'mission': CAIRO_STATION,
@@ -105,7 +146,8 @@ SOUNDS_TO_CHECK = {
             260, # Cortana, assessment.
             270, # The explosion ... a bomb.
             280, # Then they ... find it.
-        }
+        },
+        'optional': True, # Hangar 2 skip.
     },
     'arbiter_start': {
         'mission': THE_ARBITER,
@@ -119,7 +161,8 @@ SOUNDS_TO_CHECK = {
         'indices': {
             470, # Deal with him, my brothers.
             480, # I will defend the Oracle.
-        }
+        },
+        'optional': True, # Arbiter glass clip.
     },
     'SKIP_oracle_start_standard': {
         'mission': ORACLE,
@@ -130,6 +173,7 @@ SOUNDS_TO_CHECK = {
             70, # Hahaha, get in line.
         },
         'nototal': True,
+        'alternatives': 'oracle_start',
     },
     # It's a little bit unclear to me how dialog skip works, but I think
     # the effect is that we don't wait for the 'flattered' line.
@@ -139,7 +183,8 @@ SOUNDS_TO_CHECK = {
             50, # He's using a holo-drone. He must be close!
             60, # Come out so we may kill you.
             70, # Hahaha, get in line.
-        }
+        },
+        'alternatives': 'oracle_start',
     },
     'oracle_cables': {
         'mission': ORACLE,
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import argparse
+
+from h2lang.load_data import get_missions
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Convert an archive or pickle into a columnar store.')
+    parser.add_argument('archive', type=str, help='Path to the archive (or pickle)')
+    parser.add_argument('store', type=str, help='Directory to write the store to')
+    parser.add_argument('--shards', default=False, action='store_true',
+            help='Write one pickle per mission and language instead, which doesn\'t need numpy.')
+    parser.add_argument('--dialog', default=False, action='store_true',
+            help='Write every sound under sound/dialog of an extracted archive (combat, ambient and so on, not just '
+            'the missions) to a dialog store instead. It is streamed, so it doesn\'t need to fit in memory.')
+    parser.add_argument('--batch-size', type=int, default=None,
+            help='Number of sounds to write to the dialog store at a time.')
+    args = parser.parse_args()
+
+    if args.batch_size is not None and args.batch_size < 1:
+        sys.stderr.write('Bad batch size: {}\n'.format(args.batch_size))
+        return 1
+
+    if args.dialog:
+        if not os.path.isdir(args.archive):
+            sys.stderr.write('Not a directory: {}\n'.format(args.archive))
+            return 1
+        from h2lang.dialog import DEFAULT_BATCH_SIZE, ingest_dialog
+        num_rows, errors = ingest_dialog(args.archive, args.store,
+                DEFAULT_BATCH_SIZE if args.batch_size is None else args.batch_size)
+        for err in errors:
+            sys.stderr.write('Could not read: {}\n'.format(err))
+        print('Wrote {} sounds to {}'.format(num_rows, args.store))
+        return 0
+
+    missions = get_missions(args.archive)
+    if not missions:
+        return 1
+
+    if args.shards:
+        from h2lang.shards import write_shards
+        write_shards(missions, args.store)
+        print('Wrote shards to {}'.format(args.store))
+        return 0
+
+    from h2lang.store import write_store
+    write_store(missions, args.store)
+    print('Wrote store to {}'.format(args.store))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+
+import sys
+import argparse
+
+from h2lang.common import LANGUAGES
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Summarise a dialog store written by convert_store.py --dialog.')
+    parser.add_argument('store', type=str, help='Path to the dialog store')
+    parser.add_argument('--prefix', type=str, default='dialog/',
+            help='Only include the lines under this path, e.g. dialog/combat or dialog/combat/sgt_johnson.')
+    parser.add_argument('--missing', default=False, action='store_true',
+            help='List the sounds that some languages have but others don\'t.')
+    args = parser.parse_args()
+
+    from h2lang.dialog import DialogStore
+    try:
+        store = DialogStore(args.store)
+    except FileNotFoundError:
+        sys.stderr.write('Not a dialog store: {}\n'.format(args.store))
+        return 1
+
+    totals = store.totals(args.prefix)
+    print(' ====== {} ======'.format(args.prefix))
+    for code, (count, seconds) in sorted(totals.items(), key=lambda item: item[1][1]):
+        print('{:<10} => sounds: {:>6} total: {:.3f} s'.format(LANGUAGES.get(code, code), count, seconds))
+
+    if args.missing:
+        for code, sounds in store.missing(args.prefix).items():
+            if sounds:
+                print('\n{}:'.format(LANGUAGES.get(code, code).lower()))
+                for sound in sounds:
+                    print(sound)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
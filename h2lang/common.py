@@ -1,5 +1,10 @@
-import wave
-import contextlib
+import sys
+
+from array import array
+from collections.abc import Mapping
+from typing import Optional, Tuple
+
+from .riff import read_wav_info, split_duration
 
 LANGUAGES = {
         'de': 'German',
@@ -13,44 +18,196 @@ LANGUAGES = {
 }
 
 class SoundFile:
-    def __init__(self, filename, gd):
-        self.level = gd['level']
+    # Archives have tens of thousands of these, so they are kept small: no
+    # __dict__, the strings are interned and the duration is worked out from
+    # the integer frames and rate.
+    __slots__ = ('level', 'index', 'speaker', 'variant', 'frames', 'rate')
+
+    def __init__(self, filename, gd, info=None):
+        self.level = sys.intern(gd['level'])
         self.index = int(gd['index'], 10)
-        self.speaker = gd['speaker']
-        self.variant = gd['variant']
-        with contextlib.closing(wave.open(filename, 'rb')) as f:
-            frames = f.getnframes()
-            rate = f.getframerate()
-            self.duration = frames / rate
+        self.speaker = sys.intern(gd['speaker'])
+        self.variant = sys.intern(gd['variant'])
+        if info is None:
+            info = read_wav_info(filename)
+        self.frames = info.frames
+        self.rate = info.rate
+
+    @property
+    def duration(self) -> float:
+        return self.frames / self.rate
+
+    @classmethod
+    def from_fields(cls, level, index, speaker, variant, frames, rate):
+        fle = cls.__new__(cls)
+        fle.level = level
+        fle.index = index
+        fle.speaker = speaker
+        fle.variant = variant
+        fle.frames = frames
+        fle.rate = rate
+        return fle
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        # Old pickles have a __dict__ with the duration instead of the frames
+        # and rate.
+        state = dict(state)
+        if 'duration' in state:
+            state['frames'], state['rate'] = split_duration(state.pop('duration'))
+        for name in ('level', 'speaker', 'variant'):
+            state[name] = sys.intern(state[name])
+        for name, value in state.items():
+            setattr(self, name, value)
+
+class _Files(Mapping):
+    # Looks like the Dict[int, Set[SoundFile]] that MissionLang used to keep,
+    # building the SoundFiles of an index when it is looked up.
+    def __init__(self, m_lang):
+        self._m_lang = m_lang
+
+    def __getitem__(self, index):
+        return tuple(self._m_lang.sound(index, row) for row in self._m_lang._rows[index])
+
+    def __contains__(self, index):
+        return index in self._m_lang._rows
+
+    def __iter__(self):
+        return iter(self._m_lang._rows)
+
+    def __len__(self):
+        return len(self._m_lang._rows)
+
+    def keys(self):
+        return self._m_lang._rows.keys()
 
 class MissionLang:
+    # The sounds are kept as columns, with the rows of each index (one per
+    # variant) in a table, rather than as a set of objects per index.
     def __init__(self):
         self._extra_files = []
-        self.files = {} # Dict[int, Set[SoundFile]]
+        self._levels = []
+        self._speakers = []
+        self._variants = []
+        self._frames = array('q')
+        self._rates = array('i')
+        self._rows = {} # Dict[int, Tuple[int, ...]]
+        self._variant_rows = {} # Dict[Tuple[int, str], int]
+
+    @property
+    def files(self):
+        return _Files(self)
+
+    def rows(self, index: int) -> Tuple[int, ...]:
+        # The rows of every variant of an index, none if it doesn't exist.
+        return self._rows.get(index, ())
+
+    def row(self, index: int, variant: str) -> Optional[int]:
+        # The first sound of the variant, as find_durations has always taken.
+        return self._variant_rows.get((index, variant))
+
+    def variant_rows(self):
+        # ((index, variant), row) of every line.
+        return self._variant_rows.items()
+
+    def duration(self, row: int) -> float:
+        return self._frames[row] / self._rates[row]
+
+    def sound(self, index: int, row: int) -> SoundFile:
+        return SoundFile.from_fields(self._levels[row], index, self._speakers[row],
+                self._variants[row], self._frames[row], self._rates[row])
 
     def add_file(self, fle: SoundFile):
-        if fle.index not in self.files:
-            self.files[fle.index] = set()
-        self.files[fle.index].add(fle)
+        row = len(self._frames)
+        self._levels.append(sys.intern(fle.level))
+        self._speakers.append(sys.intern(fle.speaker))
+        self._variants.append(sys.intern(fle.variant))
+        self._frames.append(fle.frames)
+        self._rates.append(fle.rate)
+        self._rows[fle.index] = self._rows.get(fle.index, ()) + (row,)
+        self._variant_rows.setdefault((fle.index, self._variants[row]), row)
+
+    def durations(self):
+        # (index, variant, duration) of every sound, without building SoundFiles.
+        for index, rows in self._rows.items():
+            for row in rows:
+                yield index, self._variants[row], self._frames[row] / self._rates[row]
 
     def get_indices(self):
-        return self.files.keys()
+        return self._rows.keys()
 
     def matches(self, other) -> bool:
         return self.get_indices() == other.get_indices()
 
+    def __getstate__(self):
+        return {
+            '_extra_files': self._extra_files,
+            '_levels': self._levels,
+            '_speakers': self._speakers,
+            '_variants': self._variants,
+            '_frames': self._frames,
+            '_rates': self._rates,
+            '_rows': self._rows,
+        }
+
+    def __setstate__(self, state):
+        if 'files' not in state:
+            self.__dict__.update(state)
+            # Not pickled, since it is quick to build from the rows.
+            self._variant_rows = {}
+            for index, rows in self._rows.items():
+                for row in rows:
+                    self._variant_rows.setdefault((index, self._variants[row]), row)
+            return
+        # An old pickle, with a set of SoundFiles for each index.
+        self.__init__()
+        self._extra_files = state['_extra_files']
+        for files in state['files'].values():
+            for fle in files:
+                self.add_file(fle)
+
     def __repr__(self):
         return str(self)
     def __str__(self):
-        return "<MissionLang: files: {}>".format(len(self.files))
+        return "<MissionLang: files: {}>".format(len(self._rows))
 
 
 class Mission:
     def __init__(self, id):
-        self.languages = {} # Dict[str, MissionLang]
+        self._languages = {} # Dict[str, MissionLang]
+        self._load_languages = None
         self._name = id.name
         self._level = id.level
 
+    @property
+    def languages(self):
+        # Languages can be loaded on first use (see shards.py).
+        if self._load_languages:
+            load = self._load_languages
+            self._load_languages = None
+            self._languages = load()
+        return self._languages
+
+    def load_languages_lazily(self, load):
+        self._load_languages = load
+
+    # Pickles keep the layout from before languages could be lazy, so old
+    # ones still load and new ones hold every language.
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['languages'] = self.languages
+        del state['_languages']
+        del state['_load_languages']
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        self._languages = state.pop('languages')
+        self._load_languages = None
+        self.__dict__.update(state)
+
     def add_language(self, code, m_lang):
         if code in self.languages:
             raise RuntimeError(
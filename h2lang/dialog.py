@@ -0,0 +1,220 @@
+import os
+import json
+import shutil
+
+import numpy as np
+
+from collections import namedtuple
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from .riff import RiffError, read_wav_info
+from .common import LANGUAGES
+
+# Every sound under <lang>/sound/dialog of an extracted archive, not just the
+# mission folders: combat, ambient and so on. There are far too many of them
+# to load as Missions, so they are streamed from the directory walk, through
+# the header reads, into a columnar store in batches. Memory only grows with
+# the number of dialog directories, never with the number of files.
+#
+# A dialog store is a directory with one .npy file per column, in walk order
+# (language, then directory, then file name), the file names one after the
+# other in names.txt, and an index of the languages and directories ("lines",
+# e.g. dialog/combat/sgt_johnson/06_outburst/cllcoward).
+DIALOG_VERSION = 1
+DIALOG_INDEX_FILENAME = 'dialog.json'
+NAMES_FILENAME = 'names.txt'
+DEFAULT_BATCH_SIZE = 4096
+# How many of the files that couldn't be read are reported.
+MAX_ERRORS = 20
+
+COLUMNS = {
+        'language': np.uint8,
+        'line': np.int32,
+        'name_offset': np.int64,
+        'name_length': np.int32,
+        'format': np.uint16,
+        'channels': np.uint16,
+        'frames': np.int64,
+        'rate': np.int32,
+}
+
+DialogRecord = namedtuple('DialogRecord', 'language line name format channels frames rate')
+
+def walk_dialog(archive: str) -> Iterator[Tuple[str, str, os.DirEntry]]:
+    # (language, directory under sound/, entry) of every file in the dialog
+    # tree. Only one directory listing is held at a time.
+    for lang in sorted(os.listdir(archive)):
+        if lang not in LANGUAGES:
+            continue
+        root = os.path.join(archive, lang, 'sound')
+        if not os.path.isdir(os.path.join(root, 'dialog')):
+            continue
+        stack = ['dialog']
+        while stack:
+            directory = stack.pop()
+            with os.scandir(os.path.join(root, directory)) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+            subdirs = []
+            for entry in entries:
+                if entry.is_dir():
+                    subdirs.append(directory + '/' + entry.name)
+                else:
+                    yield lang, directory, entry
+            stack.extend(reversed(subdirs))
+
+def sound_entries(entries: Iterable[Tuple[str, str, os.DirEntry]]) -> Iterator[Tuple[str, str, os.DirEntry]]:
+    for lang, directory, entry in entries:
+        if entry.name.lower().endswith('.wav') and entry.is_file():
+            yield lang, directory, entry
+
+def read_records(entries: Iterable[Tuple[str, str, os.DirEntry]], errors: List[str]) -> Iterator[DialogRecord]:
+    # Files whose headers can't be read are left out, and the first few are
+    # added to `errors`.
+    for lang, directory, entry in entries:
+        try:
+            info = read_wav_info(entry.path)
+        except (OSError, ValueError, RiffError) as e:
+            if len(errors) < MAX_ERRORS:
+                errors.append('{}: {}'.format(entry.path, e))
+            continue
+        yield DialogRecord(lang, directory, entry.name, info.format_tag, info.channels, info.frames, info.rate)
+
+def batches(records: Iterable, size: int) -> Iterator[List]:
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+class DialogStoreWriter:
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        # Until close() writes the new index there is no store here, rather
+        # than an old index over columns that are half written.
+        if os.path.exists(os.path.join(path, DIALOG_INDEX_FILENAME)):
+            os.remove(os.path.join(path, DIALOG_INDEX_FILENAME))
+        # The columns are written out raw as they come, and only become .npy
+        # files (which start with their length) once everything is in.
+        self._columns = {name: open(self._column_path(name) + '.tmp', 'wb') for name in COLUMNS}
+        self._names = open(os.path.join(path, NAMES_FILENAME), 'wb')
+        self._name_offset = 0
+        self._languages = {} # Dict[str, int]
+        self._lines = {} # Dict[str, int]
+        self.num_rows = 0
+
+    def _column_path(self, name: str) -> str:
+        return os.path.join(self.path, name + '.npy')
+
+    def _id(self, ids: Dict[str, int], string: str) -> int:
+        return ids.setdefault(string, len(ids))
+
+    def write_batch(self, records: List[DialogRecord]):
+        names = [record.name.encode() for record in records]
+        lengths = np.array([len(name) for name in names], dtype=np.int64)
+        offsets = self._name_offset + np.cumsum(lengths + 1) - lengths - 1
+        columns = {
+            'language': [self._id(self._languages, record.language) for record in records],
+            'line': [self._id(self._lines, record.line) for record in records],
+            'name_offset': offsets,
+            'name_length': lengths,
+            'format': [record.format for record in records],
+            'channels': [record.channels for record in records],
+            'frames': [record.frames for record in records],
+            'rate': [record.rate for record in records],
+        }
+        for name, dtype in COLUMNS.items():
+            np.asarray(columns[name], dtype=dtype).tofile(self._columns[name])
+        self._names.write(b''.join(name + b'\n' for name in names))
+        self._name_offset += int(lengths.sum()) + len(names)
+        self.num_rows += len(records)
+
+    def close(self):
+        self._names.close()
+        for name, dtype in COLUMNS.items():
+            self._columns[name].close()
+            tmp = self._column_path(name) + '.tmp'
+            with open(self._column_path(name), 'wb') as f, open(tmp, 'rb') as raw:
+                np.lib.format.write_array_header_1_0(f, {'descr': np.dtype(dtype).str, 'fortran_order': False,
+                    'shape': (self.num_rows,)})
+                shutil.copyfileobj(raw, f)
+            os.remove(tmp)
+        # Written last, so that a store that wasn't finished isn't used.
+        with open(os.path.join(self.path, DIALOG_INDEX_FILENAME), 'w') as f:
+            json.dump({
+                'version': DIALOG_VERSION,
+                'rows': self.num_rows,
+                'languages': list(self._languages),
+                'lines': list(self._lines),
+            }, f)
+
+def ingest_dialog(archive: str, path: str, batch_size: int = DEFAULT_BATCH_SIZE) -> Tuple[int, List[str]]:
+    # Returns the number of sounds written and the first few that couldn't
+    # be read.
+    errors = []
+    writer = DialogStoreWriter(path)
+    for batch in batches(read_records(sound_entries(walk_dialog(archive)), errors), batch_size):
+        writer.write_batch(batch)
+    writer.close()
+    return writer.num_rows, errors
+
+class DialogStore:
+    def __init__(self, path: str):
+        with open(os.path.join(path, DIALOG_INDEX_FILENAME)) as f:
+            index = json.load(f)
+        if index['version'] != DIALOG_VERSION:
+            raise RuntimeError('Unsupported dialog store version {}: {}'.format(index['version'], path))
+        self.path = path
+        self.languages = index['languages']
+        self.lines = index['lines']
+        self.columns = {}
+        for name in COLUMNS:
+            self.columns[name] = np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+
+    def __len__(self):
+        return len(self.columns['line'])
+
+    def name(self, row: int) -> str:
+        with open(os.path.join(self.path, NAMES_FILENAME), 'rb') as f:
+            f.seek(int(self.columns['name_offset'][row]))
+            return f.read(int(self.columns['name_length'][row])).decode()
+
+    def names(self) -> np.ndarray:
+        # The file name of every row, in order.
+        with open(os.path.join(self.path, NAMES_FILENAME), 'rb') as f:
+            return np.array(f.read().split(b'\n')[:len(self)])
+
+    def _line_mask(self, prefix: str) -> np.ndarray:
+        # Whole path components only: dialog/combat/sgt isn't under
+        # dialog/combat/sg.
+        prefix = prefix.rstrip('/')
+        return np.array([not prefix or line == prefix or line.startswith(prefix + '/') for line in self.lines],
+            dtype=bool)
+
+    def totals(self, prefix: str = '') -> Dict[str, Tuple[int, float]]:
+        # The number of sounds and their total duration in each language, of
+        # the lines under `prefix`.
+        rows = self._line_mask(prefix)[self.columns['line']]
+        languages = self.columns['language'][rows]
+        durations = self.columns['frames'][rows] / self.columns['rate'][rows]
+        counts = np.bincount(languages, minlength=len(self.languages))
+        seconds = np.bincount(languages, weights=durations, minlength=len(self.languages))
+        return {code: (int(counts[i]), float(seconds[i])) for i, code in enumerate(self.languages)}
+
+    def missing(self, prefix: str = '') -> Dict[str, List[str]]:
+        # The sounds (line/name) under `prefix` that some languages have but
+        # each language doesn't.
+        rows = np.flatnonzero(self._line_mask(prefix)[self.columns['line']])
+        if not len(rows):
+            return {code: [] for code in self.languages}
+        names, name_ids = np.unique(self.names()[rows], return_inverse=True)
+        lines = self.columns['line'][rows].astype(np.int64)
+        sounds, sound_ids = np.unique(lines * len(names) + name_ids, return_inverse=True)
+        present = np.zeros((len(sounds), len(self.languages)), dtype=bool)
+        present[sound_ids, self.columns['language'][rows]] = True
+        return {code: ['{}/{}'.format(self.lines[s // len(names)], names[s % len(names)].decode())
+                for s in sounds[~present[:, i]]]
+            for i, code in enumerate(self.languages)}
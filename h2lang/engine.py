@@ -0,0 +1,144 @@
+import numpy as np
+
+from typing import Dict, Tuple
+
+from .sections import section_instances
+from .speech import special_measure
+
+# Evaluates every section of SOUNDS_TO_CHECK at once. The sections are
+# compiled into flat arrays of entries (one per line in a section) that point
+# at rows of a (line, language) duration matrix, so that the total of every
+# section, language and difficulty comes out of one gather and reduce.
+
+def _variant_key(variants_to_try: Dict[int, str]) -> Tuple:
+    return tuple(sorted(variants_to_try.items()))
+
+def _find_row(language, idx, variants_to_try) -> int:
+    rows = language.rows(idx)
+    if not rows:
+        raise RuntimeError('Invalid config: could not find sound file: {}'.format(idx))
+    if idx not in variants_to_try:
+        if len(rows) > 1:
+            raise RuntimeError('Invalid config: sound file {} has multiple variants that were not specified'.format(idx))
+        return rows[0]
+    row = language.row(idx, variants_to_try[idx])
+    if row is None:
+        raise RuntimeError('Invalid config: invalid variant name specified: {}'.format(variants_to_try[idx]))
+    return row
+
+class CompiledSections:
+    def __init__(self, difficulties, speech=None):
+        self.difficulties = list(difficulties)
+        self.speech = speech
+        self.languages = [] # List[str]
+        self.sections = {} # Dict[Tuple[str, Tuple], int]
+        self.section_languages = [] # List[List[str]], in the mission's order
+        self.section_starts = []
+        self._lines = {} # Dict[Tuple, int]
+        self._line_durations = [] # List[Dict[str, float]]
+        self._entry_line = []
+        self._entry_scale = []
+        self._entry_offset = []
+        self._entry_floor = []
+        self._entry_mask = []
+        self._entry_jitter = []
+        self._entry_probability = []
+
+    def _line(self, key, mission, idx, variants_to_try, func=None, measure='duration') -> int:
+        if key not in self._lines:
+            durations = {}
+            for code, language in mission.languages.items():
+                row = _find_row(language, idx, variants_to_try)
+                if measure == 'duration':
+                    duration = language.duration(row)
+                else:
+                    duration = self.speech.measure(code, language.sound(idx, row), measure) if self.speech else None
+                    if duration is None:
+                        raise RuntimeError('Invalid config: no {} for sound file: {}'.format(measure.replace('_', ' '), idx))
+                durations[code] = func(duration) if func else duration
+            self._lines[key] = len(self._line_durations)
+            self._line_durations.append(durations)
+        return self._lines[key]
+
+    def add_section(self, name, sound, mission, variants_to_try):
+        mission_key = sound['mission'].key
+        self.sections[(name, _variant_key(variants_to_try))] = len(self.section_starts)
+        self.section_languages.append(list(mission.languages))
+        self.section_starts.append(len(self._entry_line))
+        for code in mission.languages:
+            if code not in self.languages:
+                self.languages.append(code)
+
+        for idx_or_special in sound['indices']:
+            is_special = hasattr(idx_or_special, 'calculate')
+            idx = idx_or_special.index if is_special else idx_or_special
+            func = idx_or_special._func if is_special else None
+            measure = special_measure(idx_or_special)
+            key = (mission_key, idx, variants_to_try.get(idx), func, measure)
+            self._entry_line.append(self._line(key, mission, idx, variants_to_try, func, measure))
+            if is_special and not func:
+                self._entry_scale.append(idx_or_special.scale)
+                self._entry_offset.append(idx_or_special.offset)
+            else:
+                self._entry_scale.append(1.)
+                self._entry_offset.append(0.)
+            # Whatever func returns is used as is.
+            self._entry_floor.append(not func)
+            self._entry_mask.append([not is_special or d in idx_or_special._difficulties
+                for d in self.difficulties])
+            # Only used by the sensitivity analysis (see montecarlo.py).
+            self._entry_jitter.append(getattr(idx_or_special, 'jitter', 0.))
+            self._entry_probability.append(getattr(idx_or_special, 'probability', 1.))
+
+    def finish(self):
+        # Every section is padded out to the same number of entries so that
+        # the totals are a plain sum over one axis. The padding is an extra
+        # entry pointing at an all-zero line, with a zero mask.
+        padding = len(self._entry_line)
+        line_durations = self._line_durations + [{code: 0. for code in self.languages}]
+        self.durations = np.array([[durations.get(code, np.nan) for code in self.languages]
+            for durations in line_durations], dtype=np.float64)
+        self.entry_line = np.array(self._entry_line + [len(self._line_durations)], dtype=np.intp)
+        self.entry_scale = np.array(self._entry_scale + [1.], dtype=np.float64)
+        self.entry_offset = np.array(self._entry_offset + [0.], dtype=np.float64)
+        self.entry_floor = np.array(self._entry_floor + [False], dtype=bool)
+        self.entry_mask = np.array(self._entry_mask + [[False] * len(self.difficulties)], dtype=np.float64)
+        self.entry_jitter = np.array(self._entry_jitter + [0.], dtype=np.float64)
+        self.entry_probability = np.array(self._entry_probability + [1.], dtype=np.float64)
+
+        self.section_ends = ends = self.section_starts[1:] + [padding]
+        width = max([end - start for start, end in zip(self.section_starts, ends)] + [0])
+        self.section_entries = np.full((len(self.section_starts), width), padding, dtype=np.intp)
+        for section, (start, end) in enumerate(zip(self.section_starts, ends)):
+            self.section_entries[section, :end - start] = np.arange(start, end)
+
+    def section_index(self, name: str, variants_to_try: Dict[int, str]) -> int:
+        return self.sections[(name, _variant_key(variants_to_try))]
+
+    def section_durations(self, totals: np.ndarray, name: str, variants_to_try: Dict[int, str],
+            difficulty) -> Dict[str, float]:
+        section = self.section_index(name, variants_to_try)
+        d = self.difficulties.index(difficulty)
+        return {code: float(totals[section, self.languages.index(code), d])
+                for code in self.section_languages[section]}
+
+def compile_sections(sounds_to_check, missions, difficulties, speech=None) -> CompiledSections:
+    compiled = CompiledSections(difficulties, speech)
+    for name, sound in sounds_to_check.items():
+        mission = missions.get(sound['mission'].key)
+        if not mission:
+            continue
+        for variants_to_try in section_instances(sound):
+            compiled.add_section(name, sound, mission, variants_to_try)
+    compiled.finish()
+    return compiled
+
+def evaluate(compiled: CompiledSections) -> np.ndarray:
+    # Returns the totals as a (section, language, difficulty) array.
+    values = compiled.durations[compiled.entry_line]
+    adjusted = values * compiled.entry_scale[:, None] + compiled.entry_offset[:, None]
+    values = np.where(compiled.entry_floor[:, None], np.maximum(0., adjusted), values)
+    values = values[:, :, None] * compiled.entry_mask[:, None, :]
+    # Summing over the middle axis adds the entries one after the other, in
+    # the same order as find_durations does, so the totals are identical.
+    return values[compiled.section_entries].sum(axis=1)
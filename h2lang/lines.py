@@ -0,0 +1,68 @@
+from typing import List
+
+from .common import LANGUAGES
+
+# Every line of the loaded missions, built once so that problems with the
+# config or the data can be reported in full rather than one at a time.
+# Durations are looked up through each MissionLang's rows instead.
+
+class LineIndex:
+    def __init__(self, missions):
+        self.languages = {} # Dict[str, List[str]], each mission's languages in order
+        # (mission, index) -> variant -> language -> duration
+        self._lines = {} # Dict[Tuple[str, int], Dict[str, Dict[str, float]]]
+        for key, mission in missions.items():
+            self.add_mission(key, mission)
+
+    def add_mission(self, key: str, mission):
+        self.languages[key] = list(mission.languages)
+        for code, m_lang in mission.languages.items():
+            for (index, variant), row in m_lang.variant_rows():
+                self._lines.setdefault((key, index), {}).setdefault(variant, {})[code] = m_lang.duration(row)
+
+    def _missing(self, mission_key: str, present) -> str:
+        return ', '.join(LANGUAGES.get(code, code) for code in self.languages[mission_key] if code not in present)
+
+    def mismatches(self, mission_key: str) -> List[str]:
+        # The indices that some of the mission's languages don't have.
+        problems = []
+        for (key, index), variants in self._lines.items():
+            if key != mission_key:
+                continue
+            present = set(code for durations in variants.values() for code in durations)
+            if len(present) < len(self.languages[key]):
+                problems.append('index {} is missing in: {}'.format(index, self._missing(key, present)))
+        return problems
+
+    def validate(self, sounds_to_check, skip=None) -> List[str]:
+        # Checks every line of every section (apart from the ones in `skip`
+        # and those whose mission isn't loaded) and returns all the problems.
+        problems = []
+        for name, sound in sounds_to_check.items():
+            if skip and name in skip:
+                continue
+            key = sound['mission'].key
+            if key not in self.languages:
+                continue
+            variants_of_section = sound.get('variants') or {}
+            for idx_or_special in sound['indices']:
+                idx = getattr(idx_or_special, 'index', idx_or_special)
+                variants = self._lines.get((key, idx))
+                if not variants:
+                    problems.append('{}: could not find sound file: {}'.format(name, idx))
+                    continue
+                present = set(code for durations in variants.values() for code in durations)
+                if len(present) < len(self.languages[key]):
+                    problems.append('{}: sound file {} is missing in: {}'.format(name, idx, self._missing(key, present)))
+                if idx not in variants_of_section:
+                    if len(variants) > 1:
+                        problems.append('{}: sound file {} has multiple variants that were not specified: {}'.format(
+                            name, idx, ', '.join(variants)))
+                    continue
+                for variant in variants_of_section[idx]:
+                    if variant not in variants:
+                        problems.append('{}: invalid variant name specified: {}'.format(name, variant))
+                    elif len(variants[variant]) < len(present):
+                        problems.append('{}: variant {} is missing in: {}'.format(
+                            name, variant, self._missing(key, variants[variant])))
+        return problems
@@ -1,11 +1,15 @@
 import re
 import sys
 import os
-import contextlib
 import pickle
+import stat
+import itertools
 
-from typing import List, Tuple, Optional
+from collections import namedtuple
 
+from typing import List, Tuple, Optional, Dict
+
+from .riff import read_wav_info
 from .common import SoundFile, MissionLang, Mission, LANGUAGES
 from .missions import MISSIONS
 
@@ -13,36 +17,145 @@ SOUND_NAME_REGEX = '^([lcx](?P<level>[^_]+)_(?P<index>[^_]+)_(?P<speaker>[^_]+)\
 SOUND_NAME_PAT = re.compile(SOUND_NAME_REGEX)
 
 PICKLE_FILENAME = 'sound-data.pkl'
-
-def try_files(directory: str) -> Tuple[Optional[str], MissionLang]:
-    extra_files = []
-
-    final_lvl_lang = MissionLang()
-    dir_list = os.listdir(directory)
-    for sound in dir_list:
+CACHE_FILENAME = 'ingest-cache.pkl'
+CACHE_VERSION = 1
+# Marks a directory as a columnar store (see store.py) rather than an archive.
+STORE_STRINGS_FILENAME = 'strings.json'
+# Marks a directory as per-mission shards (see shards.py).
+SHARDS_INDEX_FILENAME = 'shards.json'
+# Marks a directory as a store of several archives (see versions.py).
+VERSIONS_INDEX_FILENAME = 'versions.json'
+# Archives that are read without extracting them (see packed.py).
+PACKED_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz')
+
+# What we know about a level directory from the last time it was read: the
+# directory's (size, mtime) fingerprint and, for each sound file in listing
+# order, its (size, mtime, WavInfo).
+LevelEntry = namedtuple('LevelEntry', 'fingerprint files')
+
+def _fingerprint(st: os.stat_result) -> Tuple[int, int]:
+    return st.st_size, st.st_mtime_ns
+
+def read_level(directory: str, cached: Optional[LevelEntry] = None,
+        trust_dirs: bool = False) -> Tuple[Optional[str], Optional[LevelEntry], int]:
+    # Returns the number of sound files whose headers actually had to be read,
+    # everything else is taken from the cached entry. Every sound file is
+    # stat'd, since overwriting one in place doesn't change the directory's
+    # fingerprint; with `trust_dirs`, a directory whose fingerprint hasn't
+    # changed is taken from the cache as it is.
+    fingerprint = _fingerprint(os.stat(directory))
+    if cached and cached.fingerprint == fingerprint and trust_dirs:
+        return None, cached, 0
+
+    cached_files = cached.files if cached else {}
+    files = {}
+    num_read = 0
+    for sound in os.listdir(directory):
         res = SOUND_NAME_PAT.match(sound)
         if not res:
-            extra_files.append(sound)
             continue
         full_path = os.path.join(directory, sound)
-        if not os.path.isfile(full_path):
-            return 'found sound file that is not a file: {}'.format(full_path), None
+        st = os.stat(full_path)
+        if not stat.S_ISREG(st.st_mode):
+            return 'found sound file that is not a file: {}'.format(full_path), None, num_read
 
         gd = res.groupdict()
         if any(map(lambda k: k not in gd, ['level', 'index', 'speaker'])):
-            return 'improper filename: {} (parsed: {})'.format(sound, gd), None
+            return 'improper filename: {} (parsed: {})'.format(sound, gd), None, num_read
+
+        record = cached_files.get(sound)
+        if not record or record[:2] != _fingerprint(st):
+            record = _fingerprint(st) + (read_wav_info(full_path),)
+            num_read += 1
+        files[sound] = record
 
-        parsed_file = SoundFile(full_path, gd)
-        final_lvl_lang.add_file(parsed_file)
+    return None, LevelEntry(fingerprint, files), num_read
 
-    return None, final_lvl_lang
+def mission_lang_from_entry(directory: str, entry: LevelEntry) -> MissionLang:
+    final_lvl_lang = MissionLang()
+    for sound, (_, _, info) in entry.files.items():
+        gd = SOUND_NAME_PAT.match(sound).groupdict()
+        final_lvl_lang.add_file(SoundFile(os.path.join(directory, sound), gd, info))
+    return final_lvl_lang
 
-def get_missions(archive: str):
+def try_files(directory: str) -> Tuple[Optional[str], MissionLang]:
+    err, entry, _ = read_level(directory)
+    if err:
+        return err, None
+    return None, mission_lang_from_entry(directory, entry)
+
+def load_cache(filename: str = CACHE_FILENAME) -> Dict[str, LevelEntry]:
+    if not os.path.isfile(filename):
+        return {}
+    with open(filename, 'rb') as f:
+        cache = pickle.load(f)
+    if cache.get('version') != CACHE_VERSION:
+        return {}
+    return cache['levels']
+
+def save_cache(levels: Dict[str, LevelEntry], filename: str = CACHE_FILENAME):
+    with open(filename, 'wb') as f:
+        pickle.dump({'version': CACHE_VERSION, 'levels': levels}, f)
+
+def _load_level(level_dir: str, cached: Optional[LevelEntry], trust_dirs: bool):
+    if not os.path.isdir(level_dir):
+        return 'Not a directory: {}\n'.format(level_dir), None, 0
+
+    err, entry, num_read = read_level(level_dir, cached, trust_dirs)
+    if err:
+        return 'Got error while reading archive: {}: {}\n'.format(level_dir, err), None, num_read
+    return None, entry, num_read
+
+def dump_missions(missions, filename: str = PICKLE_FILENAME):
+    with open(filename, 'wb') as f:
+        print('Dumped data to {}'.format(filename))
+        pickle.dump(missions, f)
+
+def split_version(archive: str) -> Tuple[str, Optional[str]]:
+    # The store and version name of <dir>@<name>, or (archive, None) if it
+    # isn't one (see versions.py).
+    path, sep, name = archive.rpartition('@')
+    if sep and os.path.isfile(os.path.join(path, VERSIONS_INDEX_FILENAME)):
+        return path, name
+    return archive, None
+
+def is_version_store(archive: str) -> bool:
+    path, name = split_version(archive)
+    return name is not None or os.path.isfile(os.path.join(path, VERSIONS_INDEX_FILENAME))
+
+def get_missions(archive: str, jobs: int = 1, rebuild: bool = False, trust_dirs: bool = False, io_threads: int = 0,
+        dump: bool = True):
+    # Archives that have to be read are dumped to PICKLE_FILENAME, unless
+    # `dump` is False.
     extra_files = []
 
-    if archive == PICKLE_FILENAME:
+    if is_version_store(archive):
+        from .versions import load_version
+        try:
+            return load_version(archive)
+        except KeyError as e:
+            sys.stderr.write('{}\n'.format(e.args[0]))
+            return None
+
+    if os.path.isfile(os.path.join(archive, STORE_STRINGS_FILENAME)):
+        # Only needs numpy when a store is actually used.
+        from .store import SoundStore
+        return SoundStore(archive).missions()
+
+    if os.path.isfile(os.path.join(archive, SHARDS_INDEX_FILENAME)):
+        from .shards import load_shards
+        return load_shards(archive)
+
+    if os.path.isfile(archive) and archive.lower().endswith(PACKED_SUFFIXES):
+        from .packed import load_packed
+        missions = load_packed(archive)
+        if missions and dump:
+            dump_missions(missions)
+        return missions
+
+    if os.path.isfile(archive):
         # Attempt to load the data from the pickle data.
-        with open(PICKLE_FILENAME, 'rb') as f:
+        with open(archive, 'rb') as f:
             return pickle.load(f)
 
     if not os.path.isdir(archive):
@@ -55,37 +168,72 @@ def get_missions(archive: str):
     for mission_id in MISSIONS.values():
         missions[mission_id.key] = Mission(mission_id)
 
+    # Work out every (language, mission) unit up front so that the levels can
+    # be read in any order and then merged back in this order.
+    units = [] # List[Tuple[str, Optional[MissionIdentifier], str]]
     for lang in lst:
         if lang not in LANGUAGES:
             extra_files.append(lang)
             continue
         lang_dir = os.path.join(archive, lang, 'sound', 'dialog', 'levels')
         if not os.path.isdir(lang_dir):
-            sys.stderr.write('Not a directory: {}\n'.format(lang_dir))
+            units.append((lang, None, lang_dir))
             continue
 
-        all_levels = os.listdir(lang_dir)
         for mission_id in MISSIONS.values():
-            mission = missions[mission_id.key]
-            level = mission_id.level
-            level_dir = os.path.join(lang_dir, level, 'mission')
-            if not os.path.isdir(level_dir):
-                sys.stderr.write('Not a directory: {}\n'.format(level_dir))
-                continue
-
-            err, mission_lang = try_files(level_dir)
-            if err:
-                sys.stderr.write('Got error while reading archive: {}: {}\n'.format(level_dir, err))
-                continue
-            mission.add_language(lang, mission_lang)
-            print('Loaded: {}/{}: {}'.format(mission_id.name, LANGUAGES[lang], mission_lang))
+            units.append((lang, mission_id, os.path.join(lang_dir, mission_id.level, 'mission')))
+
+    # Missions that share a level read the same directory, so each directory
+    # is only read once.
+    level_dirs = list(dict.fromkeys(d for _, mission_id, d in units if mission_id))
+    cache = {} if rebuild else load_cache()
+    cached = [cache.get(os.path.abspath(d)) for d in level_dirs]
+    if io_threads > 0:
+        from .scan import read_levels
+        results = read_levels(level_dirs, cached, trust_dirs, io_threads)
+    elif jobs > 1:
+        # Imported here since it is slow to import and most runs don't need it.
+        import concurrent.futures
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(_load_level, level_dirs, cached, itertools.repeat(trust_dirs)))
+    else:
+        results = list(map(_load_level, level_dirs, cached, itertools.repeat(trust_dirs)))
+
+    loaded = {}
+    num_unchanged = 0
+    num_reused = 0
+    num_read = 0
+    for level_dir, old_entry, (err, entry, level_num_read) in zip(level_dirs, cached, results):
+        loaded[level_dir] = (err, entry)
+        num_read += level_num_read
+        if not entry:
+            continue
+        if old_entry and old_entry.fingerprint == entry.fingerprint and not level_num_read:
+            num_unchanged += 1
+        num_reused += len(entry.files) - level_num_read
+        cache[os.path.abspath(level_dir)] = entry
+    save_cache(cache)
+    print('Ingest cache: {} of {} directories unchanged, {} sound files reused, {} read'.format(
+        num_unchanged, len(level_dirs), num_reused, num_read))
+
+    for lang, mission_id, directory in units:
+        if not mission_id:
+            sys.stderr.write('Not a directory: {}\n'.format(directory))
+            continue
+
+        err, entry = loaded[directory]
+        if err:
+            sys.stderr.write(err)
+            continue
+        mission_lang = mission_lang_from_entry(directory, entry)
+        mission = missions[mission_id.key]
+        mission.add_language(lang, mission_lang)
+        print('Loaded: {}/{}: {}'.format(mission_id.name, LANGUAGES[lang], mission_lang))
 
     if extra_files:
         sys.stderr.write('Found extra files: {}\n'.format(extra_files))
         return None
 
-    with open(PICKLE_FILENAME, 'wb') as f:
-        print('Dumped data to {}'.format(PICKLE_FILENAME))
-        pickle.dump(missions, f)
-
+    if dump:
+        dump_missions(missions)
     return missions
@@ -0,0 +1,116 @@
+import numpy as np
+
+from collections import namedtuple
+from typing import List, Optional, Sequence, Tuple
+
+from .engine import CompiledSections
+from .sections import section_instances
+
+# How sure the rankings are, given what we aren't sure about: each sample
+# draws an error for every line with a `jitter`, and whether we wait for every
+# line with a `probability` (see Special in config.py). Variants are routes,
+# not noise, so each language takes the options that are fastest for it, as
+# in the totals. Samples are worked out in batches, over the compiled
+# sections' (line, language) duration matrix.
+#
+# A line's draws are shared by every section it is in and by every language,
+# since it is the same moment in the game.
+
+DEFAULT_BATCH = 10000
+
+# The chance of a language being the fastest, and its mean total with a
+# central interval.
+LanguageOdds = namedtuple('LanguageOdds', 'language fastest mean low high')
+
+class SensitivityModel:
+    def __init__(self, compiled: CompiledSections, sections: Sequence[Tuple[str, dict]], difficulty):
+        # `sections` are the (name, sound) of the sections that are totalled.
+        d = compiled.difficulties.index(difficulty)
+        self.languages = list(compiled.languages)
+
+        # Each instance (section and combination of variants) counts for a
+        # language with a weight of 0 or 1: the ones without variants always,
+        # and the fastest option of the others.
+        instances = [] # List[int], sections of the compiled sections
+        fixed = []
+        choices = [] # List[np.ndarray], positions in `instances`
+        for name, sound in sections:
+            options = []
+            for variants_to_try in section_instances(sound):
+                options.append(len(instances))
+                instances.append(compiled.section_index(name, variants_to_try))
+            if len(options) > 1:
+                choices.append(np.array(options, dtype=np.intp))
+            else:
+                fixed.extend(options)
+        self._num_instances = len(instances)
+
+        # The lines that are certain add the same to an instance every time.
+        values = compiled.durations[compiled.entry_line]
+        adjusted = values * compiled.entry_scale[:, None] + compiled.entry_offset[:, None]
+        values = np.where(compiled.entry_floor[:, None], np.maximum(0., adjusted), values)
+        # Languages that a mission doesn't have add nothing, as in the totals.
+        values = np.nan_to_num(values)
+        adjusted = np.nan_to_num(np.where(compiled.entry_floor[:, None], adjusted, values))
+
+        uncertain = (compiled.entry_jitter > 0) | (compiled.entry_probability < 1)
+        self._constant = np.zeros((self._num_instances, len(self.languages)))
+        entries = []
+        entry_instances = []
+        for position, section in enumerate(instances):
+            for entry in range(compiled.section_starts[section], compiled.section_ends[section]):
+                if not compiled.entry_mask[entry, d]:
+                    continue
+                if uncertain[entry]:
+                    entries.append(entry)
+                    entry_instances.append(position)
+                else:
+                    self._constant[position] += values[entry]
+        entries = np.array(entries, dtype=np.intp)
+        entry_instances = np.array(entry_instances, dtype=np.intp)
+
+        # Options are picked by their totals without any errors, as
+        # LanguageTotalTracker.best_combination does.
+        expected = self._constant.copy()
+        np.add.at(expected, entry_instances, values[entries])
+        weights = np.zeros((self._num_instances, len(self.languages)))
+        weights[fixed] = 1.
+        languages = np.arange(len(self.languages))
+        for options in choices:
+            weights[options[expected[options].argmin(axis=0)], languages] = 1.
+        self._constant = (weights * self._constant).sum(axis=0)
+        # (uncertain line, language): whether the line counts for the language.
+        self._entry_weights = weights[entry_instances]
+        # Before flooring at 0, so that the error is added first.
+        self._base = adjusted[entries]
+        self._jitter = compiled.entry_jitter[entries]
+        self._probability = compiled.entry_probability[entries]
+        lines, self._entry_draw = np.unique(compiled.entry_line[entries], return_inverse=True)
+        self._num_draws = len(lines)
+
+    @property
+    def num_uncertain(self) -> int:
+        # The number of lines with a jitter or probability.
+        return self._num_draws
+
+    def sample(self, n: int, rng: np.random.Generator) -> np.ndarray:
+        # Returns the totals of `n` samples as an (n, language) array.
+        totals = np.tile(self._constant, (n, 1))
+        if self._num_draws:
+            errors = rng.standard_normal((n, self._num_draws))[:, self._entry_draw] * self._jitter
+            waited = rng.random((n, self._num_draws))[:, self._entry_draw] < self._probability
+            values = np.maximum(0., self._base[None, :, :] + errors[:, :, None])
+            totals += np.einsum('nu,ul,nul->nl', waited.astype(np.float64), self._entry_weights, values)
+        return totals
+
+    def run(self, samples: int, seed: Optional[int] = None, batch: int = DEFAULT_BATCH,
+            interval: float = 0.95) -> List[LanguageOdds]:
+        rng = np.random.default_rng(seed)
+        totals = np.concatenate([self.sample(min(batch, samples - start), rng)
+            for start in range(0, samples, batch)])
+        fastest = np.bincount(totals.argmin(axis=1), minlength=len(self.languages)) / samples
+        tail = (1 - interval) / 2 * 100
+        low, high = np.percentile(totals, [tail, 100 - tail], axis=0)
+        mean = totals.mean(axis=0)
+        return [LanguageOdds(lang, float(fastest[i]), float(mean[i]), float(low[i]), float(high[i]))
+            for i, lang in enumerate(self.languages)]
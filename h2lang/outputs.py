@@ -0,0 +1,105 @@
+import os
+import json
+import hashlib
+
+from typing import Dict, List, Optional
+
+# Keeps track of what each generated file (e.g. under output/) was made from,
+# so that a batch run only regenerates the files whose inputs changed. The
+# inputs of a file are a JSON-able dict: the data version, the difficulty,
+# and the sections that went into it with their fingerprints. Files are
+# written to the side and moved into place, and only if their text changed,
+# so that unchanged files keep their modification times and don't show up in
+# diffs.
+MANIFEST_FILENAME = 'output-manifest.json'
+# Bump this when anything about how the files are written changes.
+MANIFEST_VERSION = 1
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode()).hexdigest()
+
+def inputs_hash(inputs: Dict) -> str:
+    return hashlib.sha1(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+def _file_hash(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return text_hash(f.read())
+    except OSError:
+        return None
+
+def write_if_changed(path: str, text: str) -> bool:
+    # Returns whether the file was written.
+    if _file_hash(path) == text_hash(text):
+        return False
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write(text)
+    os.replace(tmp, path)
+    return True
+
+def _describe_changes(old: Dict, new: Dict) -> List[str]:
+    changes = []
+    for key in sorted(set(old) | set(new)):
+        if old.get(key) == new.get(key):
+            continue
+        if key == 'sections':
+            old_sections = {entry[0]: entry for entry in old.get(key) or []}
+            new_sections = {entry[0]: entry for entry in new.get(key) or []}
+            added = [name for name in new_sections if name not in old_sections]
+            removed = [name for name in old_sections if name not in new_sections]
+            changed = [name for name in new_sections if name in old_sections and new_sections[name] != old_sections[name]]
+            for label, names in (('added', added), ('removed', removed), ('changed', changed)):
+                if names:
+                    changes.append('sections {}: {}'.format(label, ', '.join(names)))
+            if not changes:
+                changes.append('section order changed')
+        else:
+            changes.append('{} changed'.format(key))
+    return changes
+
+class OutputManifest:
+    def __init__(self, filename: str = MANIFEST_FILENAME):
+        self.filename = filename
+        self._outputs = {} # Dict[str, Dict], by path relative to the manifest
+        self._changed = False
+        if os.path.isfile(filename):
+            with open(filename) as f:
+                manifest = json.load(f)
+            if manifest.get('version') == MANIFEST_VERSION:
+                self._outputs = manifest['outputs']
+
+    def _key(self, path: str) -> str:
+        return os.path.relpath(path, os.path.dirname(os.path.abspath(self.filename))).replace(os.sep, '/')
+
+    def changes(self, path: str, inputs: Dict) -> List[str]:
+        # Why `path` has to be written again, or nothing if it is up to date.
+        entry = self._outputs.get(self._key(path))
+        if entry is None:
+            return ['not generated yet']
+        file_hash = _file_hash(path)
+        if file_hash is None:
+            return ['missing']
+        if entry['inputs_hash'] != inputs_hash(inputs):
+            return _describe_changes(entry['inputs'], inputs) or ['inputs changed']
+        if file_hash != entry['text_hash']:
+            return ['edited since it was generated']
+        return []
+
+    def record(self, path: str, inputs: Dict, text: str):
+        self._outputs[self._key(path)] = {
+            'inputs_hash': inputs_hash(inputs),
+            'text_hash': text_hash(text),
+            'inputs': inputs,
+        }
+        self._changed = True
+
+    def save(self):
+        if not self._changed:
+            return
+        tmp = self.filename + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'version': MANIFEST_VERSION, 'outputs': self._outputs}, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.filename)
+        self._changed = False
@@ -0,0 +1,146 @@
+import sys
+import posixpath
+import tarfile
+import zipfile
+
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from .riff import Reader, RiffError, WavInfo, parse_wav_info
+from .common import SoundFile, MissionLang, Mission, LANGUAGES
+from .missions import MISSIONS
+from .load_data import SOUND_NAME_PAT
+
+# Reads the sound headers straight out of a .zip or .tar(.gz) of an archive,
+# without extracting it. Members are read one after the other, and only up to
+# the end of their headers, so memory doesn't grow with the size of the
+# archive. The members can be anywhere under a common root, e.g.
+#   dump/<lang>/sound/dialog/levels/<level>/mission/*.wav
+
+# Skipped data is read (and thrown away) in pieces of this size.
+SKIP_SIZE = 1 << 16
+# How deep under the top of the file the language directories can be.
+MAX_ROOT_DEPTH = 3
+
+def stream_reader(read: Callable[[int], bytes]) -> Reader:
+    # A Reader over a stream that can only be read forwards. parse_wav_info
+    # never reads before the end of its last read, apart from going back
+    # into the last piece, which is kept.
+    buffer = b''
+    start = 0
+    def stream_read(offset, n):
+        nonlocal buffer, start
+        if offset < start:
+            raise RiffError('cannot read backwards in a stream (from {} to {})'.format(start, offset))
+        if offset < start + len(buffer):
+            buffer = buffer[offset - start:]
+        else:
+            skip = offset - start - len(buffer)
+            while skip > 0:
+                skipped = read(min(skip, SKIP_SIZE))
+                if not skipped:
+                    break
+                skip -= len(skipped)
+            buffer = b''
+        start = offset
+        if len(buffer) < n:
+            buffer += read(n - len(buffer))
+        return buffer[:n]
+    return stream_read
+
+def split_member_name(name: str) -> Optional[Tuple[str, str, str]]:
+    # Returns (language, level, filename) for a sound file in a level's
+    # mission directory, and None for anything else.
+    parts = name.strip('/').split('/')
+    if len(parts) < 7 or parts[-2] != 'mission' or parts[-6:-3] != ['sound', 'dialog', 'levels']:
+        return None
+    return parts[-7], parts[-3], parts[-1]
+
+def _zip_members(archive: str) -> Iterator[Tuple[str, bool, Callable[[], object]]]:
+    with zipfile.ZipFile(archive) as zf:
+        for info in zf.infolist():
+            yield info.filename, not info.is_dir(), lambda info=info: zf.open(info)
+
+def _tar_members(archive: str) -> Iterator[Tuple[str, bool, Callable[[], object]]]:
+    # Compressed tars are read through the gzip/bz2/lzma file objects, which
+    # only decompress forwards when skipping over members. (Stream mode,
+    # 'r|*', is much slower at skipping.)
+    with tarfile.open(archive, mode='r:*') as tar:
+        while True:
+            member = tar.next()
+            if member is None:
+                break
+            # The tar remembers every member it has read, which would grow
+            # with the archive, and nothing needs them again.
+            tar.members = []
+            yield member.name, member.isfile(), lambda member=member: tar.extractfile(member)
+
+def read_packed_levels(archive: str):
+    # Returns (error, languages, levels): the language directories in the
+    # order they were found, and the sounds of each (language, level) in
+    # member order.
+    members = _zip_members(archive) if archive.lower().endswith('.zip') else _tar_members(archive)
+    languages = {} # Dict[str, None], in order
+    levels = {} # Dict[Tuple[str, str], Dict[str, WavInfo]]
+    root = None
+    # The first few directories of every member, to find anything that is
+    # next to the language directories. Deeper directories aren't needed.
+    prefixes = {} # Dict[Tuple[str, ...], None], in order
+    for name, is_file, open_member in members:
+        parts = name.strip('/').split('/')
+        prefixes.setdefault(tuple(parts[:MAX_ROOT_DEPTH + 1]), None)
+        split = split_member_name(name)
+        if not split:
+            continue
+        lang, level, sound = split
+        if not SOUND_NAME_PAT.match(sound):
+            continue
+        if not is_file:
+            return 'found sound file that is not a file: {}'.format(name), None, None
+        if root is None:
+            root = tuple(parts[:-7])
+        languages.setdefault(lang, None)
+        with open_member() as f:
+            info = parse_wav_info(stream_reader(f.read), '{}:{}'.format(archive, name))
+        levels.setdefault((lang, level), {})[sound] = info
+
+    # Anything else next to the language directories is unexpected, as it
+    # is in an extracted archive.
+    root = root or ()
+    for prefix in prefixes:
+        if len(prefix) > len(root) and prefix[:len(root)] == root:
+            languages.setdefault(prefix[len(root)], None)
+    return None, list(languages), levels
+
+def load_packed(archive: str) -> Optional[Dict[str, Mission]]:
+    err, languages, levels = read_packed_levels(archive)
+    if err:
+        sys.stderr.write('Got error while reading archive: {}: {}\n'.format(archive, err))
+        return None
+    print('Read {} sound files from {}'.format(sum(len(files) for files in levels.values()), archive))
+
+    missions = {}
+    for mission_id in MISSIONS.values():
+        missions[mission_id.key] = Mission(mission_id)
+
+    extra_files = []
+    for lang in languages:
+        if lang not in LANGUAGES:
+            extra_files.append(lang)
+            continue
+        for mission_id in MISSIONS.values():
+            files = levels.get((lang, mission_id.level))
+            if files is None:
+                sys.stderr.write('Not a directory: {}\n'.format(
+                    posixpath.join(archive, lang, 'sound', 'dialog', 'levels', mission_id.level, 'mission')))
+                continue
+            mission_lang = MissionLang()
+            for sound, info in files.items():
+                gd = SOUND_NAME_PAT.match(sound).groupdict()
+                mission_lang.add_file(SoundFile(sound, gd, info))
+            missions[mission_id.key].add_language(lang, mission_lang)
+            print('Loaded: {}/{}: {}'.format(mission_id.name, LANGUAGES[lang], mission_lang))
+
+    if extra_files:
+        sys.stderr.write('Found extra files: {}\n'.format(extra_files))
+        return None
+    return missions
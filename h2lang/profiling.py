@@ -0,0 +1,127 @@
+import os
+import sys
+import json
+import time
+import pickle
+import threading
+import functools
+import tracemalloc
+
+from typing import Dict
+
+# Times and counts the stages of a run for --profile. Nothing here is hooked
+# in unless a Profiler is installed, so normal runs don't pay for it.
+
+class _Stage():
+    def __init__(self):
+        self.calls = 0
+        self.time = 0.
+        self.peak_memory = 0
+
+class _PatternProxy():
+    # Compiled patterns can't have their methods replaced, so stand in for one.
+    def __init__(self, pattern, match):
+        self._pattern = pattern
+        self.match = match
+
+    def __getattr__(self, name):
+        return getattr(self._pattern, name)
+
+class Profiler():
+    def __init__(self):
+        self.stages = {} # Dict[str, _Stage]
+        self.counters = {} # Dict[str, int]
+        self._stack = [] # List[List], each [start memory, highest peak seen]
+        self._patches = []
+
+    def count(self, name: str, amount: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def _enter(self):
+        current, peak = tracemalloc.get_traced_memory()
+        if self._stack:
+            # Resetting the peak would lose the enclosing stage's, so keep it.
+            self._stack[-1][1] = max(self._stack[-1][1], peak)
+        tracemalloc.reset_peak()
+        self._stack.append([current, current])
+        return time.perf_counter()
+
+    def _exit(self, name: str, start_time: float):
+        elapsed = time.perf_counter() - start_time
+        start_memory, peak_seen = self._stack.pop()
+        peak = max(tracemalloc.get_traced_memory()[1], peak_seen)
+        if self._stack:
+            self._stack[-1][1] = max(self._stack[-1][1], peak)
+        stage = self.stages.setdefault(name, _Stage())
+        stage.calls += 1
+        stage.time += elapsed
+        stage.peak_memory = max(stage.peak_memory, peak - start_memory)
+
+    def wrap(self, func, name: str, counter=None):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            # Stages are nested on one stack, so only the main thread is timed.
+            if threading.current_thread() is not threading.main_thread():
+                return func(*args, **kwargs)
+            start_time = self._enter()
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                self._exit(name, start_time)
+            if counter:
+                counter(result)
+            return result
+        return wrapper
+
+    def patch(self, namespace, attr: str, name: str, counter=None):
+        # Replaces namespace.attr (or namespace[attr] for a dict, e.g. a
+        # script's globals()) with a timed version until uninstall().
+        if isinstance(namespace, dict):
+            original = namespace[attr]
+            namespace[attr] = self.wrap(original, name, counter)
+        else:
+            original = getattr(namespace, attr)
+            setattr(namespace, attr, self.wrap(original, name, counter))
+        self._patches.append((namespace, attr, original))
+
+    def install(self):
+        from . import common, load_data
+
+        tracemalloc.start()
+        self.patch(os, 'listdir', 'os.listdir')
+        self.patch(os, 'pread', 'os.pread', lambda data: self.count('bytes read', len(data)))
+        self.patch(pickle, 'load', 'pickle.load')
+        self.patch(load_data, 'read_wav_info', 'read_wav_info', lambda _: self.count('files scanned'))
+        self.patch(common, 'read_wav_info', 'read_wav_info', lambda _: self.count('files scanned'))
+
+        pattern = load_data.SOUND_NAME_PAT
+        load_data.SOUND_NAME_PAT = _PatternProxy(pattern, self.wrap(pattern.match, 'SOUND_NAME_PAT.match'))
+        self._patches.append((load_data, 'SOUND_NAME_PAT', pattern))
+
+    def uninstall(self):
+        for namespace, attr, original in reversed(self._patches):
+            if isinstance(namespace, dict):
+                namespace[attr] = original
+            else:
+                setattr(namespace, attr, original)
+        self._patches = []
+        tracemalloc.stop()
+
+    def to_dict(self) -> Dict:
+        return {
+            'stages': {name: {'calls': s.calls, 'time': s.time, 'peak_memory': s.peak_memory}
+                for name, s in self.stages.items()},
+            'counters': dict(self.counters),
+        }
+
+    def print_out(self, stream=sys.stderr):
+        stream.write(' ====== Profile ======\n')
+        stream.write('{:24s} {:>8s} {:>12s} {:>14s}\n'.format('stage', 'calls', 'time (s)', 'peak mem (KiB)'))
+        for name, s in sorted(self.stages.items(), key=lambda i: -i[1].time):
+            stream.write('{:24s} {:8d} {:12.6f} {:14.1f}\n'.format(name, s.calls, s.time, s.peak_memory / 1024))
+        for name, value in self.counters.items():
+            stream.write('{}: {}\n'.format(name, value))
+
+    def write_json(self, filename: str):
+        with open(filename, 'w') as f:
+            json.dump(self.to_dict(), f, indent=4)
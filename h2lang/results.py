@@ -0,0 +1,87 @@
+import os
+import pickle
+import hashlib
+
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+# Section durations kept from one run to the next. Each is keyed by the
+# version of its mission's data, the section's fingerprint (see sections.py),
+# its variants and the difficulty, so a run only works out what is new. The
+# least recently used results are dropped once there are too many.
+RESULTS_FILENAME = 'results-cache.pkl'
+# Bump this when the way durations are worked out changes.
+RESULTS_VERSION = 1
+DEFAULT_MAX_ENTRIES = 4096
+
+def mission_version(mission) -> str:
+    # Changes whenever any of a mission's sounds does, going by what was
+    # actually loaded rather than by the files, so it doesn't matter how they
+    # changed or where they came from.
+    h = hashlib.sha1()
+    for code, m_lang in sorted(mission.languages.items()):
+        h.update(repr((code, sorted(m_lang.durations()))).encode())
+    return h.hexdigest()
+
+class DataVersion:
+    # The version of each mission's data, only worked out (and, for missions
+    # that are loaded lazily, loaded) once it is needed.
+    def __init__(self, missions):
+        self._missions = missions
+        self._versions = {} # Dict[str, str]
+
+    def mission(self, key: str) -> Optional[str]:
+        if key not in self._missions:
+            return None
+        if key not in self._versions:
+            self._versions[key] = mission_version(self._missions[key])
+        return self._versions[key]
+
+    def of(self, keys: Iterable[str]) -> str:
+        # The version of several missions' data together.
+        return hashlib.sha1(repr([(key, self.mission(key)) for key in sorted(set(keys))]).encode()).hexdigest()
+
+class ResultCache:
+    def __init__(self, filename: str = RESULTS_FILENAME, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.filename = filename
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict() # OrderedDict[Tuple, Dict[str, float]], oldest first
+        self._changed = False
+        if os.path.isfile(filename):
+            with open(filename, 'rb') as f:
+                cache = pickle.load(f)
+            if cache.get('version') == RESULTS_VERSION:
+                self._entries = OrderedDict(cache['entries'])
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key) -> Optional[Dict[str, float]]:
+        durations = self._entries.get(key)
+        if durations is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        self._changed = True
+        return durations
+
+    def put(self, key, durations: Dict[str, float]):
+        self._entries[key] = durations
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._changed = True
+
+    def save(self):
+        if not self._changed:
+            return
+        # Written to the side and moved into place, so that an interrupted
+        # run doesn't leave half a cache behind.
+        tmp = self.filename + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump({'version': RESULTS_VERSION, 'entries': list(self._entries.items())}, f)
+        os.replace(tmp, self.filename)
+        self._changed = False
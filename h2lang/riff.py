@@ -0,0 +1,149 @@
+import os
+import struct
+
+from collections import namedtuple
+from typing import Callable, Tuple
+
+# Only the chunk headers are needed to work out the duration of a sound, so we
+# read this much up front and only go back to the file for chunks past it.
+HEADER_SIZE = 512
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_ADPCM = 0x0002
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_IMA_ADPCM = 0x0011
+WAVE_FORMAT_XBOX_ADPCM = 0x0069
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+XBOX_ADPCM_SAMPLES_PER_BLOCK = 64
+
+# Sample rates used by the dialogue. Old data only kept the duration of each
+# sound, and these are enough to get the exact frame count back from it.
+COMMON_RATES = (22050, 44100, 24000, 48000, 32000, 16000, 11025, 8000)
+
+WavInfo = namedtuple('WavInfo', 'format_tag channels rate frames')
+WavLayout = namedtuple('WavLayout', 'format_tag channels rate bits block_align samples_per_block data_offset data_size')
+
+class RiffError(RuntimeError):
+    pass
+
+# Reads `size` bytes at `offset`, returning fewer at the end of the file.
+Reader = Callable[[int, int], bytes]
+
+def buffered_reader(read: Reader, size: int = HEADER_SIZE) -> Reader:
+    head = read(0, size)
+    def buffered_read(offset, n):
+        if offset + n <= len(head):
+            return head[offset:offset + n]
+        return read(offset, n)
+    return buffered_read
+
+def _adpcm_frames(format_tag, data_size, channels, block_align, samples_per_block) -> int:
+    frames = data_size // block_align * samples_per_block
+    remaining = data_size % block_align
+    # A short final block still holds the samples that fit in it.
+    if format_tag == WAVE_FORMAT_IMA_ADPCM and remaining > 4 * channels:
+        frames += 1 + (remaining - 4 * channels) * 2 // channels
+    elif format_tag == WAVE_FORMAT_ADPCM and remaining > 7 * channels:
+        frames += 2 + (remaining - 7 * channels) * 2 // channels
+    return frames
+
+def _read_chunks(read: Reader, name: str):
+    # Returns (is_xwma, fmt, fact, dpds, data_offset, data_size).
+    riff = read(0, 12)
+    if len(riff) < 12 or riff[:4] != b'RIFF' or riff[8:12] not in (b'WAVE', b'XWMA'):
+        raise RiffError('not a RIFF WAVE file: {}'.format(name))
+    is_xwma = riff[8:12] == b'XWMA'
+
+    fmt = None
+    fact = None
+    dpds = None
+    data_offset = None
+    data_size = None
+    offset = 12
+    while True:
+        header = read(offset, 8)
+        if len(header) < 8:
+            break
+        chunk_id = header[:4]
+        chunk_size, = struct.unpack('<I', header[4:])
+        if chunk_id == b'fmt ':
+            fmt = read(offset + 8, min(chunk_size, 40))
+        elif chunk_id == b'fact' and chunk_size >= 4:
+            fact, = struct.unpack('<I', read(offset + 8, 4))
+        elif chunk_id == b'dpds' and chunk_size >= 4:
+            # The last entry is the total number of decoded bytes.
+            dpds, = struct.unpack('<I', read(offset + 8 + chunk_size - 4, 4))
+        elif chunk_id == b'data':
+            data_offset = offset + 8
+            data_size = chunk_size
+            # The fmt, fact and dpds chunks come before the data.
+            if fmt is not None and (dpds is not None or not is_xwma):
+                break
+        # Chunks are padded to an even number of bytes.
+        offset += 8 + chunk_size + (chunk_size & 1)
+
+    if fmt is None or len(fmt) < 16:
+        raise RiffError('missing fmt chunk: {}'.format(name))
+    if data_size is None:
+        raise RiffError('missing data chunk: {}'.format(name))
+    return is_xwma, fmt, fact, dpds, data_offset, data_size
+
+def _parse_fmt(fmt: bytes, name: str):
+    # Returns (format_tag, channels, rate, byte_rate, block_align, bits, extra).
+    format_tag, channels, rate, byte_rate, block_align, bits = struct.unpack('<HHIIHH', fmt[:16])
+    extra = fmt[18:]
+    if format_tag == WAVE_FORMAT_EXTENSIBLE and len(extra) >= 8:
+        # The real format tag is the start of the sub-format GUID.
+        format_tag, = struct.unpack('<H', extra[6:8])
+    if channels == 0 or rate == 0:
+        raise RiffError('bad fmt chunk: {}'.format(name))
+    return format_tag, channels, rate, byte_rate, block_align, bits, extra
+
+def _samples_per_block(extra: bytes) -> int:
+    if len(extra) >= 2:
+        samples_per_block, = struct.unpack('<H', extra[:2])
+        return samples_per_block
+    return XBOX_ADPCM_SAMPLES_PER_BLOCK
+
+def parse_wav_info(read: Reader, name: str = '<wav>') -> WavInfo:
+    is_xwma, fmt, fact, dpds, _, data_size = _read_chunks(read, name)
+    format_tag, channels, rate, byte_rate, block_align, bits, extra = _parse_fmt(fmt, name)
+
+    if format_tag in (WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT) and not is_xwma:
+        frames = data_size // (channels * ((bits + 7) // 8))
+    elif is_xwma:
+        if dpds is None:
+            raise RiffError('missing dpds chunk: {}'.format(name))
+        frames = dpds // (channels * ((bits or 16) // 8))
+    elif fact is not None:
+        frames = fact
+    elif format_tag in (WAVE_FORMAT_ADPCM, WAVE_FORMAT_IMA_ADPCM, WAVE_FORMAT_XBOX_ADPCM) and block_align:
+        frames = _adpcm_frames(format_tag, data_size, channels, block_align, _samples_per_block(extra))
+    elif byte_rate:
+        frames = data_size * rate // byte_rate
+    else:
+        raise RiffError('cannot work out the length of format {:#06x}: {}'.format(format_tag, name))
+
+    return WavInfo(format_tag, channels, rate, frames)
+
+def parse_wav_layout(read: Reader, name: str = '<wav>') -> WavLayout:
+    # Where the sound data is and how it is encoded, for reading the samples
+    # themselves (parse_wav_info only needs the headers).
+    _, fmt, _, _, data_offset, data_size = _read_chunks(read, name)
+    format_tag, channels, rate, _, block_align, bits, extra = _parse_fmt(fmt, name)
+    return WavLayout(format_tag, channels, rate, bits, block_align, _samples_per_block(extra), data_offset, data_size)
+
+def read_wav_info(filename: str) -> WavInfo:
+    fd = os.open(filename, os.O_RDONLY)
+    try:
+        return parse_wav_info(buffered_reader(lambda offset, n: os.pread(fd, n, offset)), filename)
+    finally:
+        os.close(fd)
+
+def split_duration(duration: float) -> Tuple[int, int]:
+    for rate in COMMON_RATES:
+        frames = round(duration * rate)
+        if frames / rate == duration:
+            return frames, rate
+    raise RiffError('cannot find a sample rate for duration: {}'.format(duration))
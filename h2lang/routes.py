@@ -0,0 +1,168 @@
+import math
+
+from collections import namedtuple
+from typing import Dict, List, Tuple
+
+# A decision on the route: which of `options` is taken. Each option has a
+# label (None when there is nothing worth printing, e.g. a section that is
+# just included) and the time it adds to each language.
+Choice = namedtuple('Choice', 'name options')
+
+# The fastest language on a route, and how far ahead of the next one it is.
+RouteResult = namedtuple('RouteResult', 'route language total runner_up margin')
+
+def _min_index(values) -> int:
+    return min(range(len(values)), key=values.__getitem__)
+
+def _max_index(values) -> int:
+    return max(range(len(values)), key=values.__getitem__)
+
+class RouteOptimizer():
+    def __init__(self, fixed: Dict[str, float], choices: List[Choice]):
+        self.languages = list(fixed)
+        self.fixed = fixed
+        self.choices = choices
+
+    def evaluate(self, route: Tuple[int, ...]) -> Dict[str, float]:
+        totals = dict(self.fixed)
+        for choice, option in zip(self.choices, route):
+            for lang, dur in choice.options[option][1].items():
+                totals[lang] += dur
+        return totals
+
+    def result(self, route: Tuple[int, ...]) -> RouteResult:
+        totals = self.evaluate(route)
+        ordered = sorted(totals, key=totals.get)
+        runner_up = ordered[1] if len(ordered) > 1 else None
+        margin = totals[runner_up] - totals[ordered[0]] if runner_up else 0.
+        return RouteResult(route, ordered[0], totals[ordered[0]], runner_up, margin)
+
+    def labels(self, route: Tuple[int, ...]) -> List[str]:
+        return [choice.options[option][0] for choice, option in zip(self.choices, route)
+                if choice.options[option][0]]
+
+    def fastest_route(self) -> RouteResult:
+        # Choices add up independently, so each language's fastest route takes
+        # its fastest option everywhere.
+        best = None
+        for lang in self.languages:
+            route = tuple(_min_index([opt[1][lang] for opt in choice.options]) for choice in self.choices)
+            total = self.evaluate(route)[lang]
+            if best is None or total < best[1]:
+                best = (route, total)
+        return self.result(best[0])
+
+    def best_margin(self, lang: str) -> RouteResult:
+        # Finds the route on which `lang` is furthest ahead of every other
+        # language (or, if it is never fastest, the least far behind).
+        #
+        # The search goes one choice at a time, keeping only partial routes
+        # whose leads over the other languages are not all beaten by another
+        # partial route (routes that tie are merged), and dropping any that
+        # can't beat the best complete route found so far even if every
+        # remaining choice went its way.
+        others = [o for o in self.languages if o != lang]
+        if not others:
+            return self.result(tuple(0 for _ in self.choices))
+
+        def lead(durations):
+            return tuple(durations[o] - durations[lang] for o in others)
+
+        # Decide the choices that matter most first, so that bounds tighten early.
+        diffs = [[lead(opt[1]) for opt in choice.options] for choice in self.choices]
+        order = sorted(range(len(self.choices)),
+                key=lambda c: -max(max(d) - min(d) for d in zip(*diffs[c])))
+        diffs = [diffs[c] for c in order]
+        start = lead(self.fixed)
+
+        def value(route):
+            return min(start[j] + sum(diffs[c][o][j] for c, o in enumerate(route)) for j in range(len(others)))
+
+        # Any weighting of the leads gives an upper bound: the smallest lead is
+        # never more than their weighted average, and the best weighted average
+        # can be found one choice at a time. Each single lead is a weighting,
+        # and the rest come from searching for the weighting with the tightest
+        # bound. Its best routes are also good starting guesses.
+        weightings = _weightings(start, diffs)
+        # rest[k][w]: the most the weighted lead can grow over choices k onwards.
+        rest = [[0.] * len(weightings)]
+        for options in reversed(diffs):
+            rest.insert(0, [r + max(sum(x * y for x, y in zip(w, d)) for d in options)
+                for w, r in zip(weightings, rest[0])])
+
+        best_route = max((tuple(_max_index([sum(x * y for x, y in zip(w, d)) for d in options])
+                for options in diffs) for w in weightings), key=value)
+        best_route = _improve(best_route, diffs, value)
+        best_value = value(best_route)
+
+        states = {start: ()}
+        for k, options in enumerate(diffs):
+            new_states = {}
+            for lead_so_far, route in states.items():
+                for option, d in enumerate(options):
+                    new_lead = tuple(s + x for s, x in zip(lead_so_far, d))
+                    if new_lead in new_states:
+                        continue
+                    bound = min(sum(x * y for x, y in zip(w, new_lead)) + r
+                            for w, r in zip(weightings, rest[k + 1]))
+                    if bound <= best_value:
+                        continue
+                    new_states[new_lead] = route + (option,)
+            states = _non_dominated(new_states)
+            if k + 1 == len(diffs) and states:
+                candidate = max(states.values(), key=value)
+                if value(candidate) > best_value:
+                    best_route, best_value = candidate, value(candidate)
+
+        route = [0] * len(self.choices)
+        for c, option in zip(order, best_route):
+            route[c] = option
+        totals = self.evaluate(tuple(route))
+        runner_up = min(others, key=totals.get)
+        return RouteResult(tuple(route), lang, totals[lang], runner_up, totals[runner_up] - totals[lang])
+
+def _weightings(start, diffs, iterations=200) -> List[Tuple[float, ...]]:
+    # Looks for the weighting of the leads whose bound is tightest, moving
+    # weight towards whichever leads come out smallest on its best route.
+    dims = len(start)
+    weightings = [tuple(1. if i == j else 0. for i in range(dims)) for j in range(dims)]
+    scale = max([abs(x) for options in diffs for d in options for x in d] + [abs(x) for x in start] + [1.])
+    w = [1. / dims] * dims
+    for it in range(iterations):
+        lead = list(start)
+        for options in diffs:
+            d = max(options, key=lambda d: sum(x * y for x, y in zip(w, d)))
+            lead = [l + x for l, x in zip(lead, d)]
+        if it % 20 == 0:
+            weightings.append(tuple(w))
+        step = 1. / (scale * (1 + it) ** 0.5)
+        w = [x * math.exp(-step * l) for x, l in zip(w, lead)]
+        total = sum(w)
+        w = [x / total for x in w]
+    weightings.append(tuple(w))
+    return weightings
+
+def _improve(route, diffs, value) -> Tuple[int, ...]:
+    # Changes one choice at a time for as long as that helps.
+    route = list(route)
+    improved = True
+    while improved:
+        improved = False
+        for c, options in enumerate(diffs):
+            current = value(route)
+            for option in range(len(options)):
+                old = route[c]
+                route[c] = option
+                if value(route) > current:
+                    current = value(route)
+                    improved = True
+                else:
+                    route[c] = old
+    return tuple(route)
+
+def _non_dominated(states: Dict[Tuple[float, ...], Tuple[int, ...]]) -> Dict[Tuple[float, ...], Tuple[int, ...]]:
+    kept = {}
+    for lead in sorted(states, key=sum, reverse=True):
+        if not any(all(k >= l for k, l in zip(other, lead)) for other in kept):
+            kept[lead] = states[lead]
+    return kept
@@ -0,0 +1,73 @@
+import os
+import stat
+import asyncio
+import concurrent.futures
+
+from typing import List, Optional, Tuple
+
+from .riff import read_wav_info
+from .load_data import SOUND_NAME_PAT, LevelEntry, _fingerprint
+
+# Reads level directories with many directory listings and header reads in
+# flight at once, for archives on network mounts where every call is a round
+# trip. The results are the same as load_data._load_level's, level by level.
+# os.scandir gives the names and file types together, so only the sounds
+# themselves are stat'd (for the ingest cache).
+
+DEFAULT_THREADS = 16
+
+def _scan_directory(directory: str):
+    # Returns None if `directory` isn't one, as os.path.isdir would.
+    try:
+        st = os.stat(directory)
+    except OSError:
+        return None
+    if not stat.S_ISDIR(st.st_mode):
+        return None
+    with os.scandir(directory) as it:
+        entries = [(entry.name, entry) for entry in it if SOUND_NAME_PAT.match(entry.name)]
+    return _fingerprint(st), entries
+
+def _read_file(entry: os.DirEntry, record) -> Tuple[Optional[str], Optional[tuple], bool]:
+    # Returns (error, (size, mtime, WavInfo), whether the header was read).
+    if not entry.is_file():
+        return 'found sound file that is not a file: {}'.format(entry.path), None, False
+    gd = SOUND_NAME_PAT.match(entry.name).groupdict()
+    if any(map(lambda k: k not in gd, ['level', 'index', 'speaker'])):
+        return 'improper filename: {} (parsed: {})'.format(entry.name, gd), None, False
+    fingerprint = _fingerprint(entry.stat())
+    if record and record[:2] == fingerprint:
+        return None, record, False
+    return None, fingerprint + (read_wav_info(entry.path),), True
+
+async def _read_level(loop, pool, directory: str, cached: Optional[LevelEntry], trust_dirs: bool):
+    scanned = await loop.run_in_executor(pool, _scan_directory, directory)
+    if scanned is None:
+        return 'Not a directory: {}\n'.format(directory), None, 0
+    fingerprint, entries = scanned
+    if cached and cached.fingerprint == fingerprint and trust_dirs:
+        return None, cached, 0
+
+    cached_files = cached.files if cached else {}
+    results = await asyncio.gather(*(loop.run_in_executor(pool, _read_file, entry, cached_files.get(name))
+        for name, entry in entries))
+
+    files = {}
+    num_read = 0
+    # Report the first problem in listing order, as the serial loader does.
+    for (name, _), (err, record, was_read) in zip(entries, results):
+        num_read += was_read
+        if err:
+            return 'Got error while reading archive: {}: {}\n'.format(directory, err), None, num_read
+        files[name] = record
+    return None, LevelEntry(fingerprint, files), num_read
+
+async def _read_levels(level_dirs, cached, trust_dirs, threads):
+    loop = asyncio.get_running_loop()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as pool:
+        return await asyncio.gather(*(_read_level(loop, pool, level_dir, old_entry, trust_dirs)
+            for level_dir, old_entry in zip(level_dirs, cached)))
+
+def read_levels(level_dirs: List[str], cached: List[Optional[LevelEntry]], trust_dirs: bool = False,
+        threads: int = DEFAULT_THREADS) -> List[Tuple[Optional[str], Optional[LevelEntry], int]]:
+    return list(asyncio.run(_read_levels(level_dirs, cached, trust_dirs, threads)))
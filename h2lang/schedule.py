@@ -0,0 +1,57 @@
+import math
+
+from collections import namedtuple
+from typing import Dict, Iterable, Optional
+
+from .missions import MISSIONS
+
+# Which language to play each mission in, when the language can be changed
+# between missions for `switch_cost` seconds each time. The best schedule that
+# ends each mission in each language only depends on the best ones that end
+# the mission before, so it is found one mission at a time, with the cost of
+# every language to every language in between.
+
+# The language of each of `missions` and the total with the switches, next to
+# the best that can be done without switching.
+LanguageSchedule = namedtuple('LanguageSchedule', 'missions languages total switches single_language single_total saved')
+
+def best_schedule(totals: Dict[str, Dict[str, float]], switch_cost: float,
+        order: Iterable[str] = MISSIONS) -> Optional[LanguageSchedule]:
+    # `totals` are each mission's time in each language. A language that a
+    # mission has no time for can't be used for it. None if no mission has
+    # any totals.
+    missions = [m for m in order if totals.get(m)]
+    if not missions:
+        return None
+    languages = list(dict.fromkeys(lang for m in missions for lang in totals[m]))
+
+    def time(mission, lang):
+        return totals[mission].get(lang, math.inf)
+
+    # cost[j]: the fastest way through the missions so far, ending in languages[j].
+    cost = [time(missions[0], lang) for lang in languages]
+    back = [] # List[List[int]], the language each one came from
+    for mission in missions[1:]:
+        new_cost = []
+        came_from = []
+        for j, lang in enumerate(languages):
+            # Staying wins ties.
+            k = min(range(len(languages)), key=lambda i: (cost[i] + (switch_cost if i != j else 0.), i != j))
+            new_cost.append(cost[k] + (switch_cost if k != j else 0.) + time(mission, lang))
+            came_from.append(k)
+        cost = new_cost
+        back.append(came_from)
+
+    j = min(range(len(languages)), key=cost.__getitem__)
+    total = cost[j]
+    schedule = [j]
+    for came_from in reversed(back):
+        j = came_from[j]
+        schedule.append(j)
+    schedule.reverse()
+    switches = sum(1 for a, b in zip(schedule, schedule[1:]) if a != b)
+
+    single = {lang: sum(time(m, lang) for m in missions) for lang in languages}
+    single_language = min(languages, key=single.get)
+    return LanguageSchedule(missions, [languages[j] for j in schedule], total, switches,
+        single_language, single[single_language], single[single_language] - total)
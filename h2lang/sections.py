@@ -0,0 +1,75 @@
+import types
+import hashlib
+import itertools
+
+from typing import Dict, List
+
+from .speech import special_measure
+
+# Helpers for the sections of SOUNDS_TO_CHECK that don't need numpy, so that
+# the command line tools can use them without importing the engine.
+
+def section_instances(sound) -> List[Dict[int, str]]:
+    # Every combination of variants that a section is evaluated with.
+    variants = sound.get('variants')
+    if not variants:
+        return [{}]
+    return [dict(zip(variants.keys(), instance)) for instance in itertools.product(*variants.values())]
+
+def _code_key(code):
+    # Nested code objects (inner lambdas, comprehensions) would otherwise be
+    # repr'd with their address, which changes from run to run.
+    consts = tuple(_code_key(c) if hasattr(c, 'co_code') else repr(c) for c in code.co_consts)
+    return (code.co_code, consts, code.co_names)
+
+def _code_names(code):
+    names = set(code.co_names)
+    for c in code.co_consts:
+        if hasattr(c, 'co_code'):
+            names |= _code_names(c)
+    return names
+
+def _value_key(value, seen):
+    if isinstance(value, types.ModuleType):
+        return ('module', value.__name__)
+    if isinstance(value, types.FunctionType):
+        return _func_key(value, seen)
+    return repr(value)
+
+def _func_key(func, seen=frozenset()):
+    # The same wherever and whenever the same function is defined, so that
+    # sections with lambdas can be looked up in a cache that outlives a run.
+    # The globals it reads (such as constants in config.py) are part of it too,
+    # since changing one changes what the function returns.
+    if func is None:
+        return None
+    if func in seen:
+        return ('recursive', func.__qualname__)
+    seen = seen | {func}
+    cells = tuple(_value_key(cell.cell_contents, seen) for cell in func.__closure__ or ())
+    names = sorted(name for name in _code_names(func.__code__) if name in func.__globals__)
+    used_globals = tuple((name, _value_key(func.__globals__[name], seen)) for name in names)
+    return (_code_key(func.__code__), repr(func.__defaults__), repr(cells), used_globals)
+
+def section_fingerprint(sound) -> str:
+    # Changes whenever anything that the durations of the section depend on
+    # does: its mission, its lines (in order if they have one, since that is
+    # the order they are added up in), how each special line is counted, and
+    # its variants.
+    indices = []
+    for idx_or_special in sound['indices']:
+        if hasattr(idx_or_special, 'calculate'):
+            special = (idx_or_special.index, idx_or_special.scale, idx_or_special.offset,
+                sorted(d.name for d in idx_or_special._difficulties), _func_key(idx_or_special._func))
+            # Only added when it is used, so that the fingerprints (and the
+            # results kept with them) stay the same for everything else.
+            measure = special_measure(idx_or_special)
+            indices.append(special if measure == 'duration' else special + (measure,))
+        else:
+            indices.append(idx_or_special)
+    if isinstance(sound['indices'], (set, frozenset)):
+        # A set has no order to speak of (one with Specials in it comes out in
+        # a different order every time config.py is loaded).
+        indices.sort(key=repr)
+    variants = sorted((sound.get('variants') or {}).items())
+    return hashlib.sha1(repr((sound['mission'].key, indices, variants)).encode()).hexdigest()
@@ -0,0 +1,51 @@
+import os
+import json
+import pickle
+import functools
+
+from typing import Dict
+
+from .common import Mission, MissionLang
+from .missions import MISSIONS
+from .load_data import SHARDS_INDEX_FILENAME as INDEX_FILENAME
+
+# The data split into one pickle per mission and language:
+#   <dir>/<mission>/<lang>.pkl
+# plus an index of the missions and their languages in order. Loading only
+# reads the index; each mission's languages are unpickled the first time they
+# are used, so a run that only looks at a few missions only reads those.
+SHARDS_VERSION = 1
+
+def _shard_filename(path: str, mission_key: str, code: str) -> str:
+    return os.path.join(path, mission_key, '{}.pkl'.format(code))
+
+def write_shards(missions: Dict[str, Mission], path: str):
+    index = {}
+    for key, mission in missions.items():
+        os.makedirs(os.path.join(path, key), exist_ok=True)
+        for code, m_lang in mission.languages.items():
+            with open(_shard_filename(path, key, code), 'wb') as f:
+                pickle.dump(m_lang, f)
+        index[key] = list(mission.languages)
+    with open(os.path.join(path, INDEX_FILENAME), 'w') as f:
+        json.dump({'version': SHARDS_VERSION, 'missions': index}, f, indent=4)
+
+def _load_languages(path: str, mission_key: str, codes) -> Dict[str, MissionLang]:
+    languages = {}
+    for code in codes:
+        with open(_shard_filename(path, mission_key, code), 'rb') as f:
+            languages[code] = pickle.load(f)
+    return languages
+
+def load_shards(path: str) -> Dict[str, Mission]:
+    with open(os.path.join(path, INDEX_FILENAME)) as f:
+        index = json.load(f)
+    if index['version'] != SHARDS_VERSION:
+        raise RuntimeError('Unsupported shards version: {}'.format(index['version']))
+
+    missions = {}
+    for key, codes in index['missions'].items():
+        mission = Mission(MISSIONS[key])
+        mission.load_languages_lazily(functools.partial(_load_languages, path, key, codes))
+        missions[key] = mission
+    return missions
@@ -0,0 +1,226 @@
+import os
+import sys
+import mmap
+import posixpath
+import itertools
+import concurrent.futures
+
+import numpy as np
+
+from typing import Iterator, List, Optional, Tuple
+
+from .riff import (RiffError, WavLayout, parse_wav_layout, WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT,
+    WAVE_FORMAT_IMA_ADPCM, WAVE_FORMAT_XBOX_ADPCM)
+from .common import LANGUAGES
+from .missions import MISSIONS
+from .load_data import SOUND_NAME_PAT
+from .speech import SpeechBounds, SpeechRecord, SpeechData
+
+# Finds where the speech in each sound file starts and ends. The sound data is
+# memory-mapped and read CHUNK_FRAMES at a time, and split into windows of
+# `window` seconds: a window is voiced if its RMS level is above
+# `threshold_db` (relative to full scale), and the speech runs from the first
+# voiced window to the end of the last one. Files are analysed in a process
+# pool, and only the ones that are new or changed since the last analysis.
+
+# The length of a window, in seconds.
+WINDOW = 0.01
+THRESHOLD_DB = -40.
+CHUNK_FRAMES = 1 << 18
+
+_IMA_STEPS = np.array([
+    7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45, 50, 55, 60, 66, 73, 80, 88,
+    97, 107, 118, 130, 143, 157, 173, 190, 209, 230, 253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658,
+    724, 796, 876, 963, 1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499, 2749, 3024, 3327, 3660,
+    4026, 4428, 4871, 5358, 5894, 6484, 7132, 7845, 8630, 9493, 10442, 11487, 12635, 13899, 15289, 16818,
+    18500, 20350, 22385, 24623, 27086, 29794, 32767], dtype=np.int32)
+_IMA_INDEX_STEPS = np.array([-1, -1, -1, -1, 2, 4, 6, 8] * 2, dtype=np.int32)
+
+def _data_end(buf, layout: WavLayout) -> int:
+    # A truncated file has less data than its header says.
+    return min(layout.data_offset + layout.data_size, len(buf))
+
+def _pcm_chunks(buf, layout: WavLayout) -> Iterator[np.ndarray]:
+    width = (layout.bits + 7) // 8
+    frame_size = width * layout.channels
+    num_frames = (_data_end(buf, layout) - layout.data_offset) // frame_size
+    for start in range(0, num_frames, CHUNK_FRAMES):
+        count = min(CHUNK_FRAMES, num_frames - start) * layout.channels
+        offset = layout.data_offset + start * frame_size
+        if layout.format_tag == WAVE_FORMAT_IEEE_FLOAT:
+            samples = np.frombuffer(buf, '<f4', count, offset).astype(np.float32)
+        elif width == 1:
+            # 8-bit samples are unsigned.
+            samples = (np.frombuffer(buf, np.uint8, count, offset).astype(np.float32) - 128) / 128
+        elif width == 3:
+            raw = np.frombuffer(buf, np.uint8, count * 3, offset).reshape(-1, 3).astype(np.int32)
+            ints = (raw[:, 0] | raw[:, 1] << 8 | raw[:, 2] << 16) << 8 >> 8
+            samples = ints.astype(np.float32) / (1 << 23)
+        else:
+            dtype = '<i2' if width == 2 else '<i4'
+            samples = np.frombuffer(buf, dtype, count, offset).astype(np.float32) / (1 << (8 * width - 1))
+        yield samples.reshape(-1, layout.channels)
+
+def _ima_chunks(buf, layout: WavLayout) -> Iterator[np.ndarray]:
+    # Each block starts with a header for each channel (the first sample and
+    # the step index), followed by 4-byte words of 8 samples for each
+    # channel in turn. Blocks don't depend on each other, so they are all
+    # decoded together, a sample at a time. Xbox ADPCM doesn't count the
+    # header's sample as part of the block.
+    channels = layout.channels
+    block_align = layout.block_align
+    words = (block_align // channels - 4) // 4
+    if words <= 0:
+        raise RiffError('bad block size: {}'.format(block_align))
+    first = 0 if layout.format_tag == WAVE_FORMAT_XBOX_ADPCM else 1
+    samples_per_block = first + words * 8
+    num_blocks = (_data_end(buf, layout) - layout.data_offset) // block_align
+    blocks_per_chunk = max(1, CHUNK_FRAMES // samples_per_block)
+    for start in range(0, num_blocks, blocks_per_chunk):
+        count = min(blocks_per_chunk, num_blocks - start)
+        raw = np.frombuffer(buf, np.uint8, count * block_align, layout.data_offset + start * block_align)
+        raw = raw.reshape(count, block_align)
+        header = raw[:, :4 * channels].reshape(count, channels, 4).astype(np.int32)
+        predictor = ((header[:, :, 0] | header[:, :, 1] << 8) ^ 0x8000) - 0x8000
+        index = np.clip(header[:, :, 2], 0, 88)
+        data = raw[:, 4 * channels:4 * channels * (words + 1)].reshape(count, words, channels, 4)
+        data = data.transpose(0, 2, 1, 3).reshape(count, channels, words * 4)
+        nibbles = np.empty((count, channels, words * 8), dtype=np.int32)
+        nibbles[:, :, 0::2] = data & 0xf
+        nibbles[:, :, 1::2] = data >> 4
+        del raw, data
+
+        decoded = np.empty((count, channels, samples_per_block), dtype=np.int32)
+        if first:
+            decoded[:, :, 0] = predictor
+        for i in range(words * 8):
+            nibble = nibbles[:, :, i]
+            step = _IMA_STEPS[index]
+            diff = (step >> 3) + (nibble & 1) * (step >> 2) + (nibble >> 1 & 1) * (step >> 1) + (nibble >> 2 & 1) * step
+            predictor = np.clip(np.where(nibble & 8, predictor - diff, predictor + diff), -32768, 32767)
+            index = np.clip(index + _IMA_INDEX_STEPS[nibble], 0, 88)
+            decoded[:, :, first + i] = predictor
+        yield decoded.transpose(0, 2, 1).reshape(-1, channels).astype(np.float32) / 32768
+
+def _sample_chunks(buf, layout: WavLayout) -> Optional[Iterator[np.ndarray]]:
+    # None for formats that can't be read.
+    if layout.format_tag == WAVE_FORMAT_PCM and layout.bits in (8, 16, 24, 32):
+        return _pcm_chunks(buf, layout)
+    if layout.format_tag == WAVE_FORMAT_IEEE_FLOAT and layout.bits == 32:
+        return _pcm_chunks(buf, layout)
+    if layout.format_tag in (WAVE_FORMAT_IMA_ADPCM, WAVE_FORMAT_XBOX_ADPCM) and layout.block_align:
+        return _ima_chunks(buf, layout)
+    return None
+
+def _window_power(samples: np.ndarray, window_frames: int) -> np.ndarray:
+    # The mean square of each window over all of its channels. Only the last
+    # window can be short.
+    num_full = len(samples) // window_frames
+    full = samples[:num_full * window_frames]
+    power = np.square(full, dtype=np.float64).reshape(num_full, window_frames * samples.shape[1]).mean(axis=1)
+    if len(samples) > len(full):
+        power = np.append(power, np.square(samples[len(full):], dtype=np.float64).mean())
+    return power
+
+def find_speech(chunks: Iterator[np.ndarray], rate: int, window: float = WINDOW,
+        threshold_db: float = THRESHOLD_DB) -> SpeechBounds:
+    # `chunks` are (frames, channels) arrays of samples between -1 and 1.
+    window_frames = max(1, int(round(window * rate)))
+    threshold = 10 ** (threshold_db / 10)
+    first = None
+    last = None
+    num_windows = 0
+    num_frames = 0
+    carry = np.zeros((0, 1), dtype=np.float32)
+    for chunk in chunks:
+        num_frames += len(chunk)
+        if len(carry):
+            chunk = np.concatenate([carry, chunk])
+        # Windows carry on into the next chunk.
+        end = len(chunk) // window_frames * window_frames
+        chunk, carry = chunk[:end], chunk[end:]
+        voiced = np.flatnonzero(_window_power(chunk, window_frames) > threshold)
+        if voiced.size:
+            first = num_windows + int(voiced[0]) if first is None else first
+            last = num_windows + int(voiced[-1])
+        num_windows += len(chunk) // window_frames
+    if len(carry) and _window_power(carry, window_frames)[0] > threshold:
+        first = num_windows if first is None else first
+        last = num_windows
+    if first is None:
+        return SpeechBounds(0., 0.)
+    return SpeechBounds(first * window_frames / rate, min((last + 1) * window_frames, num_frames) / rate)
+
+def speech_bounds(path: str, window: float = WINDOW, threshold_db: float = THRESHOLD_DB) -> SpeechBounds:
+    with open(path, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            raise RiffError('empty file: {}'.format(path))
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            if hasattr(buf, 'madvise'):
+                buf.madvise(mmap.MADV_SEQUENTIAL)
+            layout = parse_wav_layout(lambda offset, n: buf[offset:offset + n], path)
+            chunks = _sample_chunks(buf, layout)
+            if chunks is None:
+                raise RiffError('cannot read sound data of format {:#06x}'.format(layout.format_tag))
+            bounds = find_speech(chunks, layout.rate, window, threshold_db)
+            # Nothing can still be looking at the map when it is closed.
+            del chunks
+            return bounds
+
+def _analyse(path: str, window: float, threshold_db: float) -> Tuple[Optional[SpeechBounds], Optional[str]]:
+    try:
+        return speech_bounds(path, window, threshold_db), None
+    except (OSError, ValueError, RiffError) as e:
+        return None, str(e)
+
+def _sound_files(archive: str) -> Iterator[Tuple[str, str, str, os.stat_result, dict]]:
+    # (path in the archive, path, language, stat, parsed name) of every sound
+    # file that get_missions would read.
+    levels = list(dict.fromkeys(mission_id.level for mission_id in MISSIONS.values()))
+    for lang in sorted(os.listdir(archive)):
+        if lang not in LANGUAGES:
+            continue
+        for level in levels:
+            directory = posixpath.join(lang, 'sound', 'dialog', 'levels', level, 'mission')
+            if not os.path.isdir(os.path.join(archive, directory)):
+                continue
+            with os.scandir(os.path.join(archive, directory)) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+            for entry in entries:
+                match = SOUND_NAME_PAT.match(entry.name)
+                if match and entry.is_file():
+                    yield posixpath.join(directory, entry.name), entry.path, lang, entry.stat(), match.groupdict()
+
+def analyse_archive(archive: str, old: Optional[SpeechData] = None, jobs: int = 1, window: float = WINDOW,
+        threshold_db: float = THRESHOLD_DB) -> Tuple[SpeechData, int, List[str]]:
+    # Returns the speech data, how many files were analysed (the rest were
+    # kept from `old`) and the files that couldn't be.
+    settings = (window, threshold_db)
+    cached = old.records if old and old.settings == settings else {}
+    records = {}
+    todo = [] # List[Tuple[str, str, SpeechRecord]]
+    for rel_path, path, lang, st, gd in _sound_files(archive):
+        record = SpeechRecord(st.st_size, st.st_mtime_ns, sys.intern(lang), sys.intern(gd['level']),
+            int(gd['index'], 10), sys.intern(gd['variant']), None)
+        old_record = cached.get(rel_path)
+        if old_record and old_record[:-1] == record[:-1]:
+            records[rel_path] = old_record
+        else:
+            todo.append((rel_path, path, record))
+
+    paths = [path for _, path, _ in todo]
+    if jobs > 1 and len(todo) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(_analyse, paths, itertools.repeat(window), itertools.repeat(threshold_db),
+                chunksize=max(1, len(paths) // (jobs * 8))))
+    else:
+        results = [_analyse(path, window, threshold_db) for path in paths]
+
+    errors = []
+    for (rel_path, path, record), (bounds, err) in zip(todo, results):
+        if err:
+            errors.append('{}: {}'.format(path, err))
+        # Files that can't be read are kept too, so they aren't tried again
+        # until they change.
+        records[rel_path] = record._replace(bounds=bounds)
+    return SpeechData(settings, records), len(todo), errors
@@ -0,0 +1,105 @@
+import os
+import pickle
+import hashlib
+
+from collections import namedtuple
+from typing import Dict, List, Optional
+
+# When the speech in each sound file starts and ends, for the lines we only
+# wait for part of (see Special's `measure` in config.py). It is worked out
+# from the sound data itself by analyze_speech.py (see silence.py), and kept
+# in speech-data.pkl next to sound-data.pkl, with the version of each
+# mission's data it was analysed from, so that it isn't used with other data.
+# Nothing here needs numpy.
+SPEECH_FILENAME = 'speech-data.pkl'
+# Bump this when the way the bounds are worked out changes.
+SPEECH_VERSION = 2
+
+# In seconds from the start of the file.
+SpeechBounds = namedtuple('SpeechBounds', 'start end')
+# One analysed file: its size and modification time (to tell when it has to
+# be analysed again), the line it is (as in SoundFile), and its bounds, or
+# None if its sound data couldn't be read.
+SpeechRecord = namedtuple('SpeechRecord', 'size mtime language level index variant bounds')
+
+def special_measure(idx_or_special) -> str:
+    return getattr(idx_or_special, 'measure', 'duration')
+
+def uses_speech(sound) -> bool:
+    return any(special_measure(idx_or_special) != 'duration' for idx_or_special in sound['indices'])
+
+class SpeechData:
+    def __init__(self, settings, records: Dict[str, SpeechRecord], data: Optional[Dict[str, str]] = None):
+        self.settings = settings
+        self.records = records # Dict[str, SpeechRecord], by path in the archive
+        self.data = data or {} # Dict[str, str], mission -> version of its data (see results.py)
+        self._bounds = {(r.language, r.level, r.index, r.variant): r.bounds for r in records.values()}
+        self._matching = {} # Dict[str, bool], by mission
+        self.version = hashlib.sha1(repr((SPEECH_VERSION, settings, sorted(records.items()),
+            sorted(self.data.items()))).encode()).hexdigest()
+
+    def matches(self, mission_key: str, mission) -> bool:
+        # Whether the mission's data is the same as when it was analysed.
+        from .results import mission_version
+
+        if mission_key not in self._matching:
+            self._matching[mission_key] = self.data.get(mission_key) == mission_version(mission)
+        return self._matching[mission_key]
+
+    def measure(self, code: str, snd_file, measure: str) -> Optional[float]:
+        # When the speech in `snd_file` (of language `code`) starts or ends.
+        bounds = self._bounds.get((code, snd_file.level, snd_file.index, snd_file.variant))
+        if bounds is None:
+            return None
+        return bounds.start if measure == 'speech_start' else bounds.end
+
+    def validate(self, sounds_to_check, missions, skip=None) -> List[str]:
+        # Every line measured by its speech has to have been analysed, in
+        # every language and variant it can be played in.
+        problems = []
+        for name, sound in sounds_to_check.items():
+            if skip and name in skip:
+                continue
+            mission = missions.get(sound['mission'].key)
+            if not mission:
+                continue
+            if uses_speech(sound) and not self.matches(sound['mission'].key, mission):
+                problems.append('{}: {} was analysed from different sound data, run analyze_speech.py again'.format(
+                    name, SPEECH_FILENAME))
+                continue
+            variants_of_section = sound.get('variants') or {}
+            for idx_or_special in sound['indices']:
+                measure = special_measure(idx_or_special)
+                if measure == 'duration':
+                    continue
+                idx = idx_or_special.index
+                missing = []
+                for code, m_lang in mission.languages.items():
+                    for fle in m_lang.files.get(idx, ()):
+                        if idx in variants_of_section and fle.variant not in variants_of_section[idx]:
+                            continue
+                        if self.measure(code, fle, measure) is None:
+                            missing.append(code)
+                            break
+                if missing:
+                    problems.append('{}: no {} for sound file {} in: {}'.format(
+                        name, measure.replace('_', ' '), idx, ', '.join(missing)))
+        return problems
+
+def load_speech(filename: str = SPEECH_FILENAME) -> Optional[SpeechData]:
+    if not os.path.isfile(filename):
+        return None
+    with open(filename, 'rb') as f:
+        data = pickle.load(f)
+    if data.get('version') != SPEECH_VERSION:
+        return None
+    return SpeechData(data['settings'], {path: SpeechRecord(*record) for path, record in data['records'].items()},
+        data['data'])
+
+def save_speech(speech: SpeechData, filename: str = SPEECH_FILENAME):
+    # Written to the side and moved into place, as the result cache is.
+    tmp = filename + '.tmp'
+    with open(tmp, 'wb') as f:
+        pickle.dump({'version': SPEECH_VERSION, 'settings': speech.settings,
+            'records': {path: tuple(record) for path, record in speech.records.items()}, 'data': speech.data}, f)
+    os.replace(tmp, filename)
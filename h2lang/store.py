@@ -0,0 +1,233 @@
+import os
+import json
+
+import numpy as np
+
+from collections import namedtuple
+from collections.abc import Mapping
+from typing import Dict, List, Optional, Tuple
+
+from .missions import MISSIONS
+from .load_data import STORE_STRINGS_FILENAME as STRINGS_FILENAME
+
+# A store is a directory with one .npy file per column, sorted by
+# (mission, language, index, variant), and a table of the strings that the
+# columns refer to. The columns are opened with mmap, so nothing is read until
+# it is used.
+STORE_VERSION = 1
+
+COLUMNS = {
+        'mission': np.uint8,
+        'language': np.uint8,
+        'index': np.int32,
+        'variant': np.int32,
+        'speaker': np.int32,
+        'level': np.int32,
+        'frames': np.int64,
+        'rate': np.int32,
+}
+
+# Rows of the offsets table: (mission, language, start row, end row).
+OFFSETS_FILENAME = 'offsets.npy'
+
+class _StringTable:
+    def __init__(self):
+        self.strings = []
+        self._ids = {}
+
+    def id(self, string: str) -> int:
+        if string not in self._ids:
+            self._ids[string] = len(self.strings)
+            self.strings.append(string)
+        return self._ids[string]
+
+def write_store(missions, path: str):
+    strings = _StringTable()
+    languages = []
+    rows = []
+    for mission_id in MISSIONS.values():
+        if mission_id.key not in missions:
+            continue
+        mission_num = list(MISSIONS).index(mission_id.key)
+        for code, m_lang in missions[mission_id.key].languages.items():
+            if code not in languages:
+                languages.append(code)
+            for index, files in m_lang.files.items():
+                for fle in files:
+                    rows.append((mission_num, languages.index(code), index, strings.id(fle.variant),
+                        strings.id(fle.speaker), strings.id(fle.level), fle.frames, fle.rate))
+
+    # Sort by the variant name rather than its id, so that the same data
+    # always gives the same store.
+    rows.sort(key=lambda r: (r[0], r[1], r[2], strings.strings[r[3]]))
+
+    os.makedirs(path, exist_ok=True)
+    for i, (name, dtype) in enumerate(COLUMNS.items()):
+        np.save(os.path.join(path, name + '.npy'), np.array([r[i] for r in rows], dtype=dtype))
+
+    offsets = []
+    for row_num, row in enumerate(rows):
+        if not offsets or offsets[-1][:2] != [row[0], row[1]]:
+            offsets.append([row[0], row[1], row_num, row_num])
+        offsets[-1][3] = row_num + 1
+    np.save(os.path.join(path, OFFSETS_FILENAME), np.array(offsets, dtype=np.int64).reshape(-1, 4))
+
+    with open(os.path.join(path, STRINGS_FILENAME), 'w') as f:
+        json.dump({
+            'version': STORE_VERSION,
+            'missions': list(MISSIONS),
+            'languages': languages,
+            'strings': strings.strings,
+        }, f)
+
+StoredSound = namedtuple('StoredSound', 'level index speaker variant frames rate duration')
+
+class SoundStore:
+    def __init__(self, path: str):
+        with open(os.path.join(path, STRINGS_FILENAME)) as f:
+            table = json.load(f)
+        if table['version'] != STORE_VERSION:
+            raise RuntimeError('Unsupported store version {}: {}'.format(table['version'], path))
+        self.path = path
+        self.mission_keys = table['missions']
+        self.languages = table['languages']
+        self.strings = table['strings']
+        self.columns = {}
+        for name in COLUMNS:
+            self.columns[name] = np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+        self.offsets = np.load(os.path.join(path, OFFSETS_FILENAME))
+
+    def __len__(self):
+        return len(self.columns['index'])
+
+    def rows(self, mission_key: str, code: str) -> Optional[slice]:
+        mission_num = self.mission_keys.index(mission_key)
+        lang_num = self.languages.index(code)
+        match = self.offsets[(self.offsets[:, 0] == mission_num) & (self.offsets[:, 1] == lang_num)]
+        if not len(match):
+            return None
+        return slice(int(match[0, 2]), int(match[0, 3]))
+
+    def mission_languages(self, mission_key: str) -> List[str]:
+        mission_num = self.mission_keys.index(mission_key)
+        return [self.languages[l] for l in self.offsets[self.offsets[:, 0] == mission_num, 1]]
+
+    def index_rows(self, rows: slice, index: int) -> range:
+        # The rows of `index` among `rows`, which are sorted by index.
+        indices = self.columns['index'][rows]
+        start = rows.start + int(np.searchsorted(indices, index, 'left'))
+        end = rows.start + int(np.searchsorted(indices, index, 'right'))
+        return range(start, end)
+
+    def sound(self, index: int, row: int) -> StoredSound:
+        c = self.columns
+        return StoredSound(self.strings[c['level'][row]], index, self.strings[c['speaker'][row]],
+                self.strings[c['variant'][row]], int(c['frames'][row]), int(c['rate'][row]),
+                int(c['frames'][row]) / int(c['rate'][row]))
+
+    def sounds(self, rows: slice, index: int) -> List[StoredSound]:
+        return [self.sound(index, i) for i in self.index_rows(rows, index)]
+
+    def durations(self, mission_key: str, index: int, variant: Optional[str] = None) -> Dict[str, float]:
+        durations = {}
+        for code in self.mission_languages(mission_key):
+            for snd in self.sounds(self.rows(mission_key, code), index):
+                if variant is None or snd.variant == variant:
+                    durations[code] = snd.duration
+                    break
+        return durations
+
+    def missions(self) -> Dict[str, 'StoreMission']:
+        return {key: StoreMission(self, MISSIONS[key])
+                for key in self.mission_keys if self.mission_languages(key)}
+
+class _StoreFiles(Mapping):
+    # Looks like MissionLang.files, but only builds the sounds that are asked for.
+    def __init__(self, store: SoundStore, rows: slice):
+        self._store = store
+        self._rows = rows
+
+    def _indices(self) -> np.ndarray:
+        return np.unique(self._store.columns['index'][self._rows])
+
+    def __contains__(self, index) -> bool:
+        indices = self._store.columns['index'][self._rows]
+        pos = np.searchsorted(indices, index)
+        return pos < len(indices) and indices[pos] == index
+
+    def __getitem__(self, index) -> List[StoredSound]:
+        sounds = self._store.sounds(self._rows, index)
+        if not sounds:
+            raise KeyError(index)
+        return sounds
+
+    def __iter__(self):
+        return iter(self._indices().tolist())
+
+    def __len__(self) -> int:
+        return len(self._indices())
+
+class StoreMissionLang:
+    def __init__(self, store: SoundStore, rows: slice):
+        self._store = store
+        self._rows = rows
+        self.files = _StoreFiles(store, rows)
+
+    def rows(self, index: int) -> Tuple[int, ...]:
+        return tuple(self._store.index_rows(self._rows, index))
+
+    def row(self, index: int, variant: str) -> Optional[int]:
+        for row in self._store.index_rows(self._rows, index):
+            if self._store.strings[self._store.columns['variant'][row]] == variant:
+                return row
+        return None
+
+    def variant_rows(self):
+        c = self._store.columns
+        variant_rows = {}
+        for row, (index, variant) in enumerate(zip(c['index'][self._rows].tolist(),
+                c['variant'][self._rows].tolist()), self._rows.start):
+            variant_rows.setdefault((index, self._store.strings[variant]), row)
+        return variant_rows.items()
+
+    def duration(self, row: int) -> float:
+        return int(self._store.columns['frames'][row]) / int(self._store.columns['rate'][row])
+
+    def sound(self, index: int, row: int) -> StoredSound:
+        return self._store.sound(index, row)
+
+    def durations(self):
+        c = self._store.columns
+        for index, variant, frames, rate in zip(c['index'][self._rows].tolist(), c['variant'][self._rows].tolist(),
+                c['frames'][self._rows].tolist(), c['rate'][self._rows].tolist()):
+            yield index, self._store.strings[variant], frames / rate
+
+    def get_indices(self):
+        return self.files.keys()
+
+    def matches(self, other) -> bool:
+        if isinstance(other, StoreMissionLang):
+            return np.array_equal(self.files._indices(), other.files._indices())
+        return self.get_indices() == other.get_indices()
+
+    def __repr__(self):
+        return str(self)
+    def __str__(self):
+        return "<MissionLang: files: {}>".format(len(self.files))
+
+class StoreMission:
+    def __init__(self, store: SoundStore, id):
+        self._name = id.name
+        self._level = id.level
+        self.languages = {}
+        for code in store.mission_languages(id.key):
+            self.languages[code] = StoreMissionLang(store, store.rows(id.key, code))
+
+    def check_matching(self) -> bool:
+        ordered_languages = list(self.languages.values())
+        return all(m_lang.matches(ordered_languages[0]) for m_lang in ordered_languages[1:])
+
+    def __repr__(self):
+        return str(self)
+    def __str__(self):
+        return "<Mission: {}, langs: {}>".format(self._name, self.languages)
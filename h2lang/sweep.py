@@ -0,0 +1,149 @@
+import io
+import os
+import csv
+import itertools
+import concurrent.futures
+
+import numpy as np
+
+from collections import namedtuple
+from multiprocessing import shared_memory
+from typing import Iterator, List, Sequence, Tuple
+
+from .common import LANGUAGES
+from .engine import CompiledSections
+from .sections import section_instances
+
+# Works out the full game totals of every scenario in a sweep: each
+# difficulty, with and without the armory, with every subset of a few
+# sections excluded, and every combination of variants. The totals of each
+# section (from the compiled sections) are put in shared memory once, and
+# the scenarios are split between worker processes, which only get that and
+# a small plan of the sections. Each worker sends back the totals of its
+# scenarios, which are written out in order.
+
+# A totalled section, in config order: whether it is in the armory, which
+# bit of the exclude mask leaves it out (or -1), the rows of its options in
+# the section totals, and the variants of each option (if it has more than
+# one).
+PlanSection = namedtuple('PlanSection', 'armory toggle options labels')
+# Everything a worker needs besides the section totals: the sections, the
+# names of the toggled sections, and the column names.
+Plan = namedtuple('Plan', 'sections toggled languages difficulties')
+# A scenario: the difficulty's column in the section totals, whether the
+# armory is left out, and which of the toggled sections are.
+Unit = namedtuple('Unit', 'difficulty noarmory mask')
+
+# A scenario only takes about a tenth of a millisecond, so starting the
+# workers (and sending them the plan) only pays off for big sweeps: with
+# fewer scenarios than this (or only one CPU) they are worked out in this
+# process, whatever `jobs` is.
+MIN_PARALLEL_UNITS = 4096
+
+_totals = None # np.ndarray, (section, language, difficulty)
+_plan = None # Plan
+_shm = None
+
+def _attach(name: str, shape, plan: Plan):
+    global _totals, _plan, _shm
+    # Kept for as long as the worker is, since _totals is a view of it.
+    _shm = shared_memory.SharedMemory(name=name)
+    _totals = np.ndarray(shape, dtype=np.float64, buffer=_shm.buf)
+    _plan = plan
+
+def _included(section: PlanSection, unit: Unit) -> bool:
+    if section.armory and unit.noarmory:
+        return False
+    return section.toggle < 0 or not unit.mask >> section.toggle & 1
+
+def scenario_totals(unit: Unit) -> np.ndarray:
+    # Returns a (combination, language) array, with the combinations of the
+    # included sections' variants in itertools.product order. Everything is
+    # added in config order, as LanguageTotalTracker does, so the totals are
+    # identical to its.
+    totals = np.zeros(_totals.shape[1])
+    for section in _plan.sections:
+        if not _included(section, unit):
+            continue
+        options = _totals[section.options, :, unit.difficulty]
+        if len(section.options) == 1:
+            totals = totals + options[0]
+        else:
+            totals = totals[..., None, :] + options
+    return totals.reshape(-1, _totals.shape[1])
+
+def _combinations(unit: Unit) -> Iterator[str]:
+    # The names of the rows of scenario_totals(unit), as LanguageTotalTracker
+    # names them.
+    included = [section.labels for section in _plan.sections if section.labels and _included(section, unit)]
+    if not included:
+        yield ''
+        return
+    for combination in itertools.product(*included):
+        yield str([variant for option in combination for variant in option])
+
+def scenario_rows(unit: Unit) -> Tuple[str, int]:
+    # The CSV rows of a scenario, one for each combination of variants, and
+    # how many there are. They are formatted by the workers too, so that
+    # the parent only has to write them out.
+    totals = scenario_totals(unit)
+    stream = io.StringIO()
+    writer = csv.writer(stream, lineterminator='\n')
+    exclude = '+'.join(name for i, name in enumerate(_plan.toggled) if unit.mask >> i & 1)
+    prefix = [_plan.difficulties[unit.difficulty], int(unit.noarmory), exclude]
+    for combination, row, best in zip(_combinations(unit), totals, totals.argmin(axis=1)):
+        writer.writerow(prefix + [combination] + ['{:.6f}'.format(t) for t in row] + [_plan.languages[best]])
+    return stream.getvalue(), len(totals)
+
+class Sweep:
+    def __init__(self, compiled: CompiledSections, section_totals: np.ndarray, sections: Sequence[Tuple[str, dict]],
+            armory_key: str, toggled: Sequence[str]):
+        # `sections` are the (name, sound) of every totalled section, in
+        # order, and `toggled` the ones to try both with and without.
+        toggled = list(toggled)
+        plan_sections = []
+        for name, sound in sections:
+            instances = section_instances(sound)
+            plan_sections.append(PlanSection(sound['mission'].key == armory_key,
+                toggled.index(name) if name in toggled else -1,
+                [compiled.section_index(name, variants_to_try) for variants_to_try in instances],
+                [list(v.values()) for v in instances] if len(instances) > 1 else None))
+        self.plan = Plan(plan_sections, toggled, [LANGUAGES.get(code, code) for code in compiled.languages],
+            [d.name.lower() for d in compiled.difficulties])
+        self._section_totals = np.nan_to_num(section_totals)
+
+    def units(self) -> List[Unit]:
+        return [Unit(d, noarmory, mask) for d in range(len(self.plan.difficulties)) for noarmory in (False, True)
+            for mask in range(1 << len(self.plan.toggled))]
+
+    def run(self, func, jobs: int = 1) -> Iterator:
+        # func(unit) for every unit, in order.
+        units = self.units()
+        jobs = min(jobs, os.cpu_count() or 1)
+        if jobs <= 1 or len(units) < MIN_PARALLEL_UNITS:
+            global _totals, _plan
+            _totals, _plan = self._section_totals, self.plan
+            yield from map(func, units)
+            return
+        shm = shared_memory.SharedMemory(create=True, size=self._section_totals.nbytes)
+        try:
+            shared = np.ndarray(self._section_totals.shape, dtype=np.float64, buffer=shm.buf)
+            shared[:] = self._section_totals
+            del shared
+            with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=_attach,
+                    initargs=(shm.name, self._section_totals.shape, self.plan)) as pool:
+                yield from pool.map(func, units, chunksize=max(1, len(units) // (jobs * 4)))
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def write_csv(self, stream, jobs: int = 1) -> int:
+        # One row per scenario and combination of variants. Returns the
+        # number of rows.
+        csv.writer(stream, lineterminator='\n').writerow(['difficulty', 'noarmory', 'exclude', 'variants']
+            + self.plan.languages + ['fastest'])
+        num_rows = 0
+        for text, rows in self.run(scenario_rows, jobs):
+            stream.write(text)
+            num_rows += rows
+        return num_rows
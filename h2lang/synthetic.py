@@ -0,0 +1,99 @@
+import os
+import random
+import struct
+
+from typing import Dict, Iterable, List, Optional
+
+from .common import LANGUAGES
+from .missions import MISSIONS
+from .riff import COMMON_RATES
+
+# Builds fake extracted archives for benchmarking. Every sound file is a valid
+# 16-bit mono PCM WAV whose data is left as a hole in the file, so a large
+# archive takes almost no disk space but reads like the real thing.
+
+SPEAKERS = ['cor', 'jon', 'gun', 'mir', 'arb', 'tar', 'pot', 'grv']
+
+def write_wav(path: str, frames: int, rate: int, channels: int = 1, bits: int = 16):
+    block_align = channels * bits // 8
+    data_size = frames * block_align
+    header = b'RIFF' + struct.pack('<I', 36 + data_size) + b'WAVE'
+    header += b'fmt ' + struct.pack('<IHHIIHH', 16, 1, channels, rate, rate * block_align, block_align, bits)
+    header += b'data' + struct.pack('<I', data_size)
+    with open(path, 'wb') as f:
+        f.write(header)
+        f.truncate(len(header) + data_size)
+
+def level_lines(level: str, num_lines: int, required: Optional[Dict[int, List[str]]] = None,
+        variant_fraction: float = 0.05, seed: int = 0) -> Dict[int, List[str]]:
+    # Returns the variant names of each line index of a level. `required`
+    # lines (e.g. the ones SOUNDS_TO_CHECK uses) are always there, with
+    # exactly the variants given.
+    rng = random.Random('{}/{}'.format(seed, level))
+    short_level = level.split('_')[0]
+    lines = {}
+    for i in range(num_lines):
+        index = (i + 1) * 10
+        name = 'l{}_{:04d}_{}'.format(short_level, index, rng.choice(SPEAKERS))
+        if rng.random() < variant_fraction:
+            lines[index] = [name[:-4] + 'a' + name[-4:], name[:-4] + 'b' + name[-4:]]
+        else:
+            lines[index] = [name]
+    for index, variants in (required or {}).items():
+        lines[index] = list(variants) if variants else ['l{}_{:04d}_{}'.format(short_level, index, rng.choice(SPEAKERS))]
+    return lines
+
+def _sound_filename(short_level: str, index: int, variant: str) -> str:
+    speaker = variant.split('_')[-1]
+    return 'l{}_{:04d}_{}[{}].wav'.format(short_level, index, speaker, variant)
+
+def write_level(directory: str, level: str, lines: Dict[int, List[str]], seed: int = 0) -> int:
+    rng = random.Random('{}/{}/{}'.format(seed, directory, level))
+    os.makedirs(directory, exist_ok=True)
+    short_level = level.split('_')[0]
+    for index, variants in lines.items():
+        for variant in variants:
+            rate = rng.choice(COMMON_RATES[:5])
+            write_wav(os.path.join(directory, _sound_filename(short_level, index, variant)),
+                    int(rate * rng.uniform(0.5, 6.)), rate)
+    return sum(len(variants) for variants in lines.values())
+
+def _levels() -> List[str]:
+    return list(dict.fromkeys(mission_id.level for mission_id in MISSIONS.values()))
+
+def generate_archive(path: str, num_lines: int = 300, languages: Iterable[str] = LANGUAGES,
+        required: Optional[Dict[str, Dict[int, List[str]]]] = None, seed: int = 0) -> int:
+    # The layout get_missions reads:
+    #   <lang>/sound/dialog/levels/<level>/mission/*.wav
+    # Returns the number of sound files written.
+    num_files = 0
+    for level in _levels():
+        lines = level_lines(level, num_lines, (required or {}).get(level), seed=seed)
+        for lang in languages:
+            directory = os.path.join(path, lang, 'sound', 'dialog', 'levels', level, 'mission')
+            num_files += write_level(directory, level, lines, seed)
+    return num_files
+
+def generate_old_archive(path: str, num_lines: int = 300, languages: Iterable[str] = LANGUAGES,
+        required: Optional[Dict[str, Dict[int, List[str]]]] = None, seed: int = 0) -> int:
+    # The per-mission layout read by old/create_sound_data.py:
+    #   <mission>/<lang>/sound/dialog/levels/<level>/mission/*.wav
+    num_files = 0
+    for key, mission_id in MISSIONS.items():
+        lines = level_lines(mission_id.level, num_lines, (required or {}).get(mission_id.level), seed=seed)
+        for lang in languages:
+            directory = os.path.join(path, key, lang, 'sound', 'dialog', 'levels', mission_id.level, 'mission')
+            num_files += write_level(directory, mission_id.level, lines, seed)
+    return num_files
+
+def required_lines(sounds_to_check) -> Dict[str, Dict[int, List[str]]]:
+    # The lines (and variants) that a SOUNDS_TO_CHECK needs, by level.
+    required = {} # Dict[str, Dict[int, List[str]]]
+    for sound in sounds_to_check.values():
+        lines = required.setdefault(sound['mission'].level, {})
+        for idx_or_special in sound['indices']:
+            idx = getattr(idx_or_special, 'index', idx_or_special)
+            lines.setdefault(idx, [])
+        for idx, variants in (sound.get('variants') or {}).items():
+            lines[idx] = list(variants)
+    return required
@@ -0,0 +1,185 @@
+import os
+import json
+import pickle
+import hashlib
+
+from collections import namedtuple
+from typing import Dict, List, Optional, Tuple
+
+from .common import SoundFile, MissionLang, Mission
+from .missions import MISSIONS
+from .load_data import VERSIONS_INDEX_FILENAME as INDEX_FILENAME, split_version, is_version_store
+
+# Several archives (e.g. the original Xbox, PC and MCC dumps) kept side by side
+# as named versions. Everything is content-addressed, so a new version only
+# adds what isn't already stored:
+#   - a record is one sound: (language, level, index, speaker, variant,
+#     frames, rate), stored once by the SHA-1 of its fields,
+#   - a group is one MissionLang: its extra files and the digests of its
+#     records in sorted order, stored once by the SHA-1 of those. Missions that share
+#     a level share its group, and a language that didn't change between two
+#     versions is the same group in both,
+#   - a version is the group of each mission and language.
+# The records and groups that each version added are in a pack of their own
+# (packs/<n>.pkl), and the index lists the packs and versions.
+#
+# A version is used as an archive with <dir>@<name>, or just <dir> for the
+# latest one.
+VERSIONS_VERSION = 1
+PACKS_DIRNAME = 'packs'
+
+# A line whose duration is different between two versions. `old` or `new` is
+# None if it is only in one of them.
+LineChange = namedtuple('LineChange', 'level language index speaker variant old new')
+
+def _digest(data: bytes) -> bytes:
+    return hashlib.sha1(data).digest()
+
+def _record_fields(code: str, fle: SoundFile) -> Tuple:
+    return (code, fle.level, fle.index, fle.speaker, fle.variant, fle.frames, fle.rate)
+
+def _group_digest(extra_files, records: List[bytes]) -> bytes:
+    return _digest(repr(list(extra_files)).encode() + b''.join(records))
+
+class VersionStore:
+    def __init__(self, path: str):
+        self.path = path
+        self.versions = {} # Dict[str, dict], oldest first
+        self.packs = []
+        index_path = os.path.join(path, INDEX_FILENAME)
+        if os.path.isfile(index_path):
+            with open(index_path) as f:
+                index = json.load(f)
+            if index['version'] != VERSIONS_VERSION:
+                raise RuntimeError('Unsupported versions store version {}: {}'.format(index['version'], path))
+            self.versions = {version['name']: version for version in index['versions']}
+            self.packs = index['packs']
+        self._records = None # Dict[bytes, Tuple]
+        self._groups = None # Dict[bytes, Tuple[list, List[bytes]]]
+
+    def _load_packs(self):
+        if self._records is not None:
+            return
+        self._records = {}
+        self._groups = {}
+        for pack in self.packs:
+            with open(os.path.join(self.path, PACKS_DIRNAME, pack), 'rb') as f:
+                objects = pickle.load(f)
+            self._records.update(objects['records'])
+            self._groups.update(objects['groups'])
+
+    def _write(self, filename: str, write):
+        tmp = filename + '.tmp'
+        with open(tmp, 'w' if filename.endswith('.json') else 'wb') as f:
+            write(f)
+        os.replace(tmp, filename)
+
+    def version(self, name: Optional[str] = None) -> dict:
+        # The latest version if `name` is None.
+        if not self.versions:
+            raise KeyError('no versions in {}'.format(self.path))
+        if name is None:
+            name = list(self.versions)[-1]
+        if name not in self.versions:
+            raise KeyError('no version {} in {} (there are: {})'.format(name, self.path, ', '.join(self.versions)))
+        return self.versions[name]
+
+    def add(self, name: str, missions: Dict[str, Mission], source: str = '') -> Tuple[int, int]:
+        # Returns the number of records and groups that weren't stored yet.
+        if name in self.versions:
+            raise KeyError('there is already a version {} in {}'.format(name, self.path))
+        self._load_packs()
+        new_records = {}
+        new_groups = {}
+        tree = {}
+        for key, mission in missions.items():
+            tree[key] = {}
+            for code, m_lang in mission.languages.items():
+                # In a set order, so the same sounds are the same group
+                # however they were listed.
+                digests = []
+                for fields in sorted(_record_fields(code, fle) for index in m_lang.files for fle in m_lang.files[index]):
+                    record = _digest(repr(fields).encode())
+                    if record not in self._records:
+                        new_records[record] = fields
+                    digests.append(record)
+                group = _group_digest(m_lang._extra_files, digests)
+                if group not in self._groups and group not in new_groups:
+                    new_groups[group] = (list(m_lang._extra_files), digests)
+                tree[key][code] = group.hex()
+        self._records.update(new_records)
+        self._groups.update(new_groups)
+
+        os.makedirs(os.path.join(self.path, PACKS_DIRNAME), exist_ok=True)
+        if new_records or new_groups:
+            pack = '{}.pkl'.format(len(self.packs))
+            self._write(os.path.join(self.path, PACKS_DIRNAME, pack),
+                lambda f: pickle.dump({'records': new_records, 'groups': new_groups}, f))
+            self.packs.append(pack)
+        digest = hashlib.sha1(json.dumps(tree, sort_keys=True).encode()).hexdigest()
+        self.versions[name] = {'name': name, 'source': source, 'digest': digest, 'missions': tree}
+        # The index is written last, so a version is only there once all of
+        # its pack is.
+        self._write(os.path.join(self.path, INDEX_FILENAME), lambda f: json.dump({
+            'version': VERSIONS_VERSION,
+            'packs': self.packs,
+            'versions': list(self.versions.values()),
+        }, f, indent=4))
+        return len(new_records), len(new_groups)
+
+    def _mission_lang(self, group: str) -> MissionLang:
+        extra_files, records = self._groups[bytes.fromhex(group)]
+        m_lang = MissionLang()
+        m_lang._extra_files = list(extra_files)
+        for record in records:
+            code, level, index, speaker, variant, frames, rate = self._records[record]
+            m_lang.add_file(SoundFile.from_fields(level, index, speaker, variant, frames, rate))
+        return m_lang
+
+    def missions(self, name: Optional[str] = None) -> Dict[str, Mission]:
+        self._load_packs()
+        tree = self.version(name)['missions']
+        missions = {}
+        for mission_id in MISSIONS.values():
+            mission = Mission(mission_id)
+            for code, group in tree.get(mission_id.key, {}).items():
+                mission.add_language(code, self._mission_lang(group))
+            missions[mission_id.key] = mission
+        return missions
+
+    def _durations(self, group: str) -> Dict[Tuple[int, str, str], float]:
+        # By (index, speaker, variant), which is what tells sounds apart.
+        durations = {}
+        for record in self._groups[bytes.fromhex(group)][1]:
+            code, level, index, speaker, variant, frames, rate = self._records[record]
+            durations[(index, speaker, variant)] = frames / rate
+        return durations
+
+    def diff(self, old: str, new: str) -> List[LineChange]:
+        # Only languages whose groups differ are compared, and each pair of
+        # groups only once, however many missions share it.
+        self._load_packs()
+        old_tree = self.version(old)['missions']
+        new_tree = self.version(new)['missions']
+        changes = []
+        seen = set()
+        for mission_id in MISSIONS.values():
+            old_groups = old_tree.get(mission_id.key, {})
+            new_groups = new_tree.get(mission_id.key, {})
+            for code in list(dict.fromkeys(list(old_groups) + list(new_groups))):
+                old_group = old_groups.get(code)
+                new_group = new_groups.get(code)
+                if old_group == new_group or (old_group, new_group) in seen:
+                    continue
+                seen.add((old_group, new_group))
+                old_durations = self._durations(old_group) if old_group else {}
+                new_durations = self._durations(new_group) if new_group else {}
+                for line in sorted(set(old_durations) | set(new_durations)):
+                    if old_durations.get(line) != new_durations.get(line):
+                        changes.append(LineChange(mission_id.level, code, line[0], line[1], line[2],
+                            old_durations.get(line), new_durations.get(line)))
+        return changes
+
+def load_version(archive: str) -> Dict[str, Mission]:
+    path, name = split_version(archive)
+    return VersionStore(path).missions(name)
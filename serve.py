@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import sys
+import json
+import argparse
+import functools
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from typing import Dict, List, Tuple
+
+from h2lang.load_data import get_missions, split_version
+from h2lang.lines import LineIndex
+from h2lang.missions import MISSIONS
+from h2lang.sections import section_instances
+from h2lang.speech import load_speech
+from config import SOUNDS_TO_CHECK
+from check_languages import DIFFICULTIES, SectionDurations, check_data, run_scenario
+
+# Answers questions about the data over HTTP on localhost, so that other tools
+# don't have to start check_languages.py and parse what it prints. Every
+# reply is JSON, and the same question is only worked out once.
+#
+#   /sections                                   every section in the config
+#   /durations?section=S&difficulty=D           each language's time for S
+#   /fastest?mission=M&difficulty=D&exclude=S   the totals of M, fastest first
+#   /totals?difficulty=D&exclude=S&noarmory=1   every category and variant total
+#   /stats                                      how well the cache is doing
+
+class QueryError(RuntimeError):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def _ranked(durations: Dict[str, float]) -> List[str]:
+    return sorted(durations, key=durations.get)
+
+class Service():
+    def __init__(self, missions, vectorized=False, cache_size=1024, speech=None):
+        self.missions = missions
+        self.sections = SectionDurations(missions, vectorized, speech=speech)
+        # Questions that aren't cached yet go through the shared section
+        # durations one at a time, cached ones don't wait.
+        self._lock = threading.Lock()
+        self.answer = functools.lru_cache(maxsize=cache_size)(self._answer)
+
+    def query(self, url: str) -> Tuple[int, bytes]:
+        parts = urlsplit(url)
+        params = parse_qs(parts.query)
+        # Normalise the parameters so that the same question hits the cache.
+        key = tuple(sorted((name, tuple(sorted(values))) for name, values in params.items()))
+        try:
+            return 200, self.answer(parts.path.rstrip('/') or '/', key)
+        except QueryError as e:
+            return e.status, json.dumps({'error': str(e)}).encode()
+
+    def _answer(self, path: str, key) -> bytes:
+        params = dict(key)
+        handlers = {
+            '/sections': self._sections,
+            '/durations': self._durations,
+            '/fastest': self._fastest,
+            '/totals': self._totals,
+        }
+        if path not in handlers:
+            raise QueryError('unknown query: {}'.format(path), 404)
+        with self._lock:
+            return json.dumps(handlers[path](params)).encode()
+
+    def stats(self) -> bytes:
+        info = self.answer.cache_info()
+        return json.dumps({'hits': info.hits, 'misses': info.misses, 'size': info.currsize,
+            'max_size': info.maxsize}).encode()
+
+    def _param(self, params, name, default=None):
+        values = params.get(name)
+        if not values:
+            if default is None:
+                raise QueryError('missing parameter: {}'.format(name))
+            return default
+        return values[0]
+
+    def _difficulty(self, params):
+        name = self._param(params, 'difficulty', 'easy')
+        if name not in DIFFICULTIES:
+            raise QueryError('bad difficulty: {}'.format(name))
+        return DIFFICULTIES[name]
+
+    def _scenario(self, params):
+        exclude = list(params.get('exclude', ()))
+        unknown = [name for name in exclude if name not in SOUNDS_TO_CHECK]
+        if unknown:
+            raise QueryError('unknown sections: {}'.format(', '.join(unknown)))
+        noarmory = self._param(params, 'noarmory', '0') not in ('0', 'false', '')
+        totals = run_scenario(self.missions, self.sections, self._difficulty(params), noarmory=noarmory,
+                exclude=exclude, out=io.StringIO())
+        return exclude, noarmory, totals
+
+    def _sections(self, params):
+        return {'sections': [{
+            'name': name,
+            'mission': sound['mission'].key,
+            'variants': {str(idx): variants for idx, variants in (sound.get('variants') or {}).items()},
+            'nototal': bool(sound.get('nototal')),
+            'optional': bool(sound.get('optional')),
+            'alternatives': sound.get('alternatives'),
+        } for name, sound in SOUNDS_TO_CHECK.items()]}
+
+    def _durations(self, params):
+        name = self._param(params, 'section')
+        if name not in SOUNDS_TO_CHECK:
+            raise QueryError('unknown section: {}'.format(name))
+        sound = SOUNDS_TO_CHECK[name]
+        if sound['mission'].key not in self.missions:
+            raise QueryError('mission not found: {}'.format(sound['mission'].key))
+        difficulty = self._difficulty(params)
+        instances = []
+        for variants_to_try in section_instances(sound):
+            durations = self.sections.get(name, sound, variants_to_try, difficulty)
+            instances.append({
+                'variants': {str(idx): variant for idx, variant in variants_to_try.items()},
+                'durations': durations,
+                'ranking': _ranked(durations),
+            })
+        return {'section': name, 'difficulty': difficulty.name.lower(), 'instances': instances}
+
+    def _fastest(self, params):
+        mission = self._param(params, 'mission', 'Full Game')
+        if mission != 'Full Game' and mission not in MISSIONS:
+            raise QueryError('unknown mission: {}'.format(mission))
+        exclude, noarmory, totals = self._scenario(params)
+        combinations = [{'variants': variants, 'totals': durations, 'ranking': _ranked(durations)}
+                for _, variants, durations in totals.all_variant_totals([mission])]
+        if not combinations:
+            raise QueryError('nothing is counted for mission: {}'.format(mission))
+        best = {}
+        for lang in combinations[0]['totals']:
+            variants, total = totals.best_variants(mission, lang)
+            best[lang] = {'variants': variants, 'total': total}
+        return {'mission': mission, 'exclude': exclude, 'noarmory': noarmory,
+                'combinations': combinations, 'best': best,
+                'fastest': min(best, key=lambda lang: best[lang]['total'])}
+
+    def _totals(self, params):
+        exclude, noarmory, totals = self._scenario(params)
+        return {'exclude': exclude, 'noarmory': noarmory, 'totals': [
+            {'category': cat, 'variants': variants, 'totals': durations, 'ranking': _ranked(durations)}
+            for cat, variants, durations in totals.all_variant_totals()]}
+
+def make_handler(service: Service):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if urlsplit(self.path).path.rstrip('/') == '/stats':
+                status, body = 200, service.stats()
+            else:
+                status, body = service.query(self.path)
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+    return Handler
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Answer timing queries over HTTP on localhost.')
+    parser.add_argument('archive', type=str, help='Path to the archive (or pickle)')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on.')
+    parser.add_argument('--port', type=int, default=8642, help='Port to listen on.')
+    parser.add_argument('--cache-size', type=int, default=1024, help='Number of replies to keep.')
+    parser.add_argument('--vectorized', default=False, action='store_true',
+            help='Work out every section at once with numpy instead of one at a time.')
+    args = parser.parse_args()
+
+    if not os.path.exists(split_version(args.archive)[0]):
+        sys.stderr.write('Path does not exist: {}\n'.format(args.archive))
+        return 1
+    missions = get_missions(args.archive)
+    if not missions:
+        return 1
+    speech = load_speech()
+    if not check_data(missions, LineIndex({}), None, False, batch=True, speech=speech):
+        return 1
+
+    service = Service(missions, args.vectorized, args.cache_size, speech)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    print('Listening on http://{}:{}/'.format(*server.server_address[:2]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# config.py and h2lang are imported from the top of the repo, as the scripts do.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
@@ -0,0 +1,8 @@
+from config import Special, HEROIC, LEGENDARY
+
+def test_special_equality_matches_hash():
+    assert Special(800, offset=-1) == Special(800, offset=-1)
+    assert hash(Special(800, offset=-1)) == hash(Special(800, offset=-1))
+    assert Special(800) != Special(800, difficulties={HEROIC, LEGENDARY})
+    assert Special(800) != 800
+    assert len({Special(800), Special(800), Special(810)}) == 2
@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from config import SOUNDS_TO_CHECK, Special, Difficulty, HEROIC, LEGENDARY
+from h2lang.engine import compile_sections
+from h2lang.load_data import get_missions
+from h2lang.missions import ARMORY, ORACLE
+from h2lang.montecarlo import SensitivityModel
+
+# Example distributions for the uncertain lines: the ends of two armory lines
+# are cut by eye, and the heretic leader only holds us up on some runs.
+UNCERTAIN_SECTIONS = {
+    'armory_training_done': {
+        'mission': ARMORY,
+        'indices': {Special(1040, offset=-1, jitter=0.5), 3360, 990},
+    },
+    'armory_training_tram': {
+        'mission': ARMORY,
+        'indices': {Special(10, offset=-1, jitter=0.5)},
+    },
+    'oracle_heretic_leader': {
+        'mission': ORACLE,
+        'indices': {Special(800, difficulties={HEROIC, LEGENDARY})}
+            | {Special(idx, difficulties={LEGENDARY}, probability=0.8) for idx in range(830, 900, 10)},
+    },
+}
+
+@pytest.fixture(scope='module')
+def missions():
+    return get_missions(os.path.join(os.path.dirname(__file__), '..', 'sound-data.pkl'))
+
+def _model(missions, sounds, difficulty):
+    compiled = compile_sections(sounds, missions, list(Difficulty))
+    return SensitivityModel(compiled, list(sounds.items()), difficulty)
+
+def test_stock_config_is_certain(missions):
+    for difficulty in Difficulty:
+        assert _model(missions, SOUNDS_TO_CHECK, difficulty).num_uncertain == 0
+
+def test_uncertain_lines_spread_totals(missions):
+    model = _model(missions, UNCERTAIN_SECTIONS, Difficulty.LEGENDARY)
+    assert model.num_uncertain == 9
+    results = model.run(2000, seed=0)
+    assert sum(res.fastest for res in results) == pytest.approx(1.)
+    assert all(res.low < res.mean < res.high for res in results)
+
+def test_jitter_only_on_easy(missions):
+    model = _model(missions, UNCERTAIN_SECTIONS, Difficulty.EASY)
+    assert model.num_uncertain == 2
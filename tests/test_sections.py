@@ -0,0 +1,19 @@
+from config import Special
+from h2lang.missions import ARMORY
+from h2lang.results import ResultCache
+from h2lang.sections import section_fingerprint
+
+def _section(scale):
+    # A lambda reading a module global, as one in config.py would.
+    namespace = {'SCALE': scale}
+    exec('func = lambda duration: SCALE * duration', namespace)
+    return {'mission': ARMORY, 'indices': [Special(1040, func=namespace['func'])]}
+
+def test_same_function_same_fingerprint():
+    assert section_fingerprint(_section(0.5)) == section_fingerprint(_section(0.5))
+
+def test_changed_global_misses_cache(tmp_path):
+    results = ResultCache(str(tmp_path / 'results-cache.pkl'))
+    results.put((section_fingerprint(_section(0.5)),), {'en': 1.})
+    assert results.get((section_fingerprint(_section(0.75)),)) is None
+    assert results.misses == 1